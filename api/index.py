@@ -1,12 +1,466 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+import argparse
+import atexit
+import csv
+import gzip
 import json
-from datetime import datetime
+import hashlib
+import heapq
+import os
+import random
+import sys
+import sqlite3
+import tempfile
+import uuid
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from itertools import groupby, islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from queue import SimpleQueue
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 CORS(app)
 
+# Refresh fan-out settings. Each Tableau server gets at most
+# REFRESH_CONCURRENCY refresh POSTs and catalog page fetches in flight across
+# all requests; a request may ask for fewer refresh workers via "concurrency"
+# but never more than the cap.
+REFRESH_CONCURRENCY = int(os.environ.get('REFRESH_CONCURRENCY', 8))
+REFRESH_TIMEOUT = float(os.environ.get('REFRESH_TIMEOUT', 60))
+
+# Refresh type policy. "full" and "incremental" are sent as-is; "auto" runs
+# an incremental refresh for items with an incremental extract refresh task
+# on the site and falls back to a full refresh if Tableau rejects it. A
+# request may override this with "refreshType", or per item via "refreshTypes".
+REFRESH_TYPE = os.environ.get('REFRESH_TYPE', 'full')
+REFRESH_TYPES = {'full': 'FullRefresh', 'incremental': 'IncrementalRefresh'}
+REFRESH_POLICIES = set(REFRESH_TYPES) | {'auto'}
+
+# Adaptive concurrency. Within that cap, the in-flight limit for a server is
+# multiplied by AIMD_DECREASE when Tableau throttles (429/503/Retry-After),
+# at most once per AIMD_COOLDOWN seconds, and regrows by about one slot per
+# round of healthy responses.
+AIMD_MIN_LIMIT = int(os.environ.get('AIMD_MIN_LIMIT', 1))
+AIMD_DECREASE = float(os.environ.get('AIMD_DECREASE', 0.5))
+AIMD_COOLDOWN = float(os.environ.get('AIMD_COOLDOWN', 2))
+AIMD_EVENT_HISTORY = 50
+THROTTLE_STATUSES = {429, 503}
+
+_server_limiters = {}
+_server_limiters_lock = threading.Lock()
+
+# Retries. Transient failures are retried up to RETRY_MAX_ATTEMPTS times with
+# capped exponential backoff and full jitter, within RETRY_BUDGET seconds per
+# call. Refresh POSTs with an ambiguous outcome are only re-sent once the
+# site's recent jobs show no refresh was started for that workbook.
+RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', 4))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 8))
+RETRY_BUDGET = float(os.environ.get('RETRY_BUDGET', 60))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Statuses after which a refresh POST may or may not have created a job
+AMBIGUOUS_STATUSES = {500, 502, 504}
+# Allowance for clock skew when searching for a job we may have started
+JOB_CLOCK_SKEW = 60
+# That search pages through the site's recent refresh jobs (at most
+# JOB_LOOKUP_PAGES pages of 1000) and reads their details
+# JOB_LOOKUP_CONCURRENCY at a time, all through the server's adaptive
+# limiter. A job's target never changes, so details are cached and later
+# searches only read jobs they haven't seen.
+JOB_LOOKUP_PAGES = 5
+JOB_LOOKUP_CONCURRENCY = 8
+
+# Connection pooling. One requests.Session per Tableau server base URL keeps
+# TCP/TLS connections alive across pagination, refresh and job polling calls.
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', max(16, REFRESH_CONCURRENCY)))
+HTTP_KEEP_ALIVE = os.environ.get('HTTP_KEEP_ALIVE', 'true').lower() not in ('0', 'false', 'no')
+HTTP_IDLE_TIMEOUT = float(os.environ.get('HTTP_IDLE_TIMEOUT', 300))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Sign-in cache. Credentials tokens are cached per (server, site, token name)
+# until TOKEN_EXPIRY_MARGIN seconds before Tableau says they expire, so
+# signing in again with the same PAT skips the round trip (and doesn't end
+# the PAT's other session). A 401 from Tableau signs in again, once however
+# many calls hit it together, and the call is replayed with the new token.
+TOKEN_EXPIRY_MARGIN = float(os.environ.get('TOKEN_EXPIRY_MARGIN', 300))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1000))
+
+# Response compression. API responses of at least COMPRESS_MIN_SIZE bytes are
+# brotli- or gzip-encoded according to Accept-Encoding (brotli only when the
+# Brotli package is installed). Streamed responses are compressed chunk by
+# chunk, so lines still reach the browser as they are produced. Server-Sent
+# Events are left alone for the sake of proxies.
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html'}
+
+# Catalog loading. Tableau allows up to 1000 workbooks per page; pages after
+# the first are fetched concurrently, at most CATALOG_CONCURRENCY at a time.
+WORKBOOK_PAGE_SIZE = int(os.environ.get('WORKBOOK_PAGE_SIZE', 1000))
+CATALOG_CONCURRENCY = int(os.environ.get('CATALOG_CONCURRENCY', 4))
+
+# Catalog cache. Converted workbook lists are kept per (server, site, view)
+# for CATALOG_CACHE_TTL seconds, with at most CATALOG_CACHE_SIZE entries.
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 60))
+CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 32))
+# Before re-fetching an expired or force-reloaded catalog, fetch just the most
+# recently updated workbook; if it and the workbook count are unchanged, the
+# cached copy is reused instead of fetching every page again.
+CATALOG_REVALIDATE = os.environ.get('CATALOG_REVALIDATE', 'true').lower() not in ('0', 'false', 'no')
+
+# Site roles that see every workbook on a site and can share one cached view
+ADMIN_SITE_ROLES = {'ServerAdministrator', 'SiteAdministrator', 'SiteAdministratorCreator', 'SiteAdministratorExplorer'}
+
+# Admission control. When enabled for a refresh, submissions wait until fewer
+# than ADMISSION_TARGET_DEPTH extract jobs are queued or running on the site,
+# re-checking the queue every ADMISSION_POLL_INTERVAL seconds.
+ADMISSION_TARGET_DEPTH = int(os.environ.get('ADMISSION_TARGET_DEPTH', 20))
+ADMISSION_POLL_INTERVAL = float(os.environ.get('ADMISSION_POLL_INTERVAL', 15))
+
+# Submission scheduling. Refresh targets are ordered by SCHEDULE_POLICY
+# ("lpt" longest first, "spt" shortest first, or "fifo" as given) using
+# estimated run times, and the batch is simulated on BACKGROUNDER_SLOTS
+# backgrounders to predict when it finishes. Estimates come from each item's
+# smoothed past run times, else its size in MB times the observed (or
+# default) seconds per MB, else SCHEDULE_DEFAULT_SECONDS.
+SCHEDULE_POLICY = os.environ.get('SCHEDULE_POLICY', 'lpt')
+SCHEDULE_POLICIES = {'lpt', 'spt', 'fifo'}
+BACKGROUNDER_SLOTS = int(os.environ.get('BACKGROUNDER_SLOTS', 2))
+SCHEDULE_SECONDS_PER_MB = float(os.environ.get('SCHEDULE_SECONDS_PER_MB', 1.0))
+SCHEDULE_DEFAULT_SECONDS = float(os.environ.get('SCHEDULE_DEFAULT_SECONDS', 120))
+DURATION_HISTORY_SIZE = int(os.environ.get('DURATION_HISTORY_SIZE', 10000))
+DURATION_SMOOTHING = 0.3
+
+# Refresh history. Every submission and its final job outcome is recorded in
+# a SQLite database at HISTORY_DB (set it to an empty string to turn history
+# off). Writes are queued and committed together every
+# HISTORY_FLUSH_INTERVAL seconds, or once HISTORY_BATCH_SIZE are waiting. Job
+# outcomes come from the batch watcher, which runs for every batch while
+# history is on. Stats cover the last HISTORY_STATS_DAYS days by default.
+HISTORY_DB = os.environ.get('HISTORY_DB', os.path.join(tempfile.gettempdir(), 'tableau-mass-refresh.db'))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 2))
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 500))
+HISTORY_STATS_DAYS = int(os.environ.get('HISTORY_STATS_DAYS', 7))
+OUTCOME_STATUSES = {'Success', 'Failed', 'Cancelled'}
+
+# Durable refresh batches. With "async": true, /api/refresh stores the batch
+# in the SQLite queue at QUEUE_DB (empty to disable) and returns its ID
+# straight away. A worker drains the queue, checkpointing every result, and
+# a batch whose worker stops renewing its QUEUE_LEASE-second lease is picked
+# up again from its last checkpoint. Idle workers look for work every
+# QUEUE_POLL_INTERVAL seconds.
+QUEUE_DB = os.environ.get('QUEUE_DB', os.path.join(tempfile.gettempdir(), 'tableau-mass-refresh-queue.db'))
+QUEUE_LEASE = float(os.environ.get('QUEUE_LEASE', 120))
+QUEUE_POLL_INTERVAL = float(os.environ.get('QUEUE_POLL_INTERVAL', 5))
+BATCH_OPTION_KEYS = ('concurrency', 'timeout', 'refreshType', 'refreshTypes', 'admission',
+                     'schedule', 'slots', 'sizes', 'plan', 'watch')
+
+# Job status lookups. Refresh batches are remembered for BATCH_TTL seconds so
+# their jobs can be polled by batch ID; the site jobs listing is paged at most
+# JOB_QUERY_MAX_PAGES deep before falling back to per-job GETs.
+BATCH_TTL = float(os.environ.get('BATCH_TTL', 24 * 3600))
+BATCH_HISTORY_SIZE = int(os.environ.get('BATCH_HISTORY_SIZE', 256))
+JOB_QUERY_MAX_PAGES = int(os.environ.get('JOB_QUERY_MAX_PAGES', 5))
+JOB_STATUS_CONCURRENCY = int(os.environ.get('JOB_STATUS_CONCURRENCY', 8))
+
+# Job watcher. A batch's jobs are polled every WATCH_MIN_INTERVAL seconds at
+# first, backing off by WATCH_BACKOFF after each quiet poll up to
+# WATCH_MAX_INTERVAL, and given up on after WATCH_MAX_DURATION seconds.
+WATCH_MIN_INTERVAL = float(os.environ.get('WATCH_MIN_INTERVAL', 5))
+WATCH_MAX_INTERVAL = float(os.environ.get('WATCH_MAX_INTERVAL', 60))
+WATCH_BACKOFF = float(os.environ.get('WATCH_BACKOFF', 1.5))
+WATCH_MAX_DURATION = float(os.environ.get('WATCH_MAX_DURATION', 6 * 3600))
+WATCH_HEARTBEAT = 15
+# Polls a job may come back unknown (e.g. 404) before it is reported as such
+WATCH_UNKNOWN_LIMIT = 3
+
+def tableau_session(server):
+    """Return the pooled HTTP session for a Tableau server, evicting idle ones"""
+    now = time.monotonic()
+    with _sessions_lock:
+        for base, (session, last_used) in list(_sessions.items()):
+            if base != server and now - last_used > HTTP_IDLE_TIMEOUT:
+                session.close()
+                del _sessions[base]
+        
+        entry = _sessions.get(server)
+        if entry and now - entry[1] > HTTP_IDLE_TIMEOUT:
+            # Sockets idle this long have likely been dropped by the server
+            entry[0].close()
+            entry = None
+        
+        if entry is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            if not HTTP_KEEP_ALIVE:
+                session.headers['Connection'] = 'close'
+            entry = [session, now]
+            _sessions[server] = entry
+        
+        entry[1] = now
+        return entry[0]
+
+class AdaptiveLimiter:
+    """AIMD (additive-increase, multiplicative-decrease) in-flight limit for one server"""
+    def __init__(self, max_limit, min_limit=AIMD_MIN_LIMIT):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.throttle_count = 0
+        self.throttle_events = deque(maxlen=AIMD_EVENT_HISTORY)
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        with self._cond:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._cond.wait(pause if pause > 0 else None)
+            self.in_flight += 1
+    
+    def release(self, status_code=None, retry_after=None):
+        """Free a slot and adjust the limit from the response that came back"""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            
+            if status_code in THROTTLE_STATUSES or retry_after:
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                # A burst of throttled responses from one round counts once
+                if now - self.last_decrease >= AIMD_COOLDOWN:
+                    self.limit = max(self.min_limit, self.limit * AIMD_DECREASE)
+                    self.last_decrease = now
+                self.throttle_count += 1
+                self.throttle_events.append({
+                    'at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    'status': status_code,
+                    'retryAfter': retry_after,
+                    'limit': int(self.limit)
+                })
+            elif status_code is not None and status_code < 500:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            
+            self._cond.notify_all()
+    
+    def snapshot(self):
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'maxLimit': self.max_limit,
+                'inFlight': self.in_flight,
+                'pausedFor': max(0, round(self.paused_until - time.monotonic(), 1)),
+                'throttleCount': self.throttle_count,
+                'recentThrottles': list(self.throttle_events)
+            }
+
+def server_limiter(server):
+    """Return the adaptive limiter for in-flight calls to a server"""
+    with _server_limiters_lock:
+        if server not in _server_limiters:
+            _server_limiters[server] = AdaptiveLimiter(REFRESH_CONCURRENCY)
+        return _server_limiters[server]
+
+def retry_after_seconds(resp):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None"""
+    value = resp.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(when.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt, deadline, retry_after=None):
+    """Return the wait before retrying after failed attempt number attempt (0-based).
+
+    Returns None when the attempts or the time budget are used up.
+    """
+    if attempt + 1 >= RETRY_MAX_ATTEMPTS:
+        return None
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    delay = max(delay, retry_after or 0)
+    if time.monotonic() + delay > deadline:
+        return None
+    return delay
+
+def expiry_seconds(estimate):
+    """Parse Tableau's estimatedTimeToExpiration ("hhh:mm:ss") into seconds"""
+    try:
+        hours, minutes, seconds = (int(part) for part in estimate.split(':'))
+        return hours * 3600 + minutes * 60 + seconds
+    except (AttributeError, ValueError):
+        return None
+
+class TokenStore:
+    """Server-side cache of Tableau credentials tokens with single-flight sign-in.
+
+    Entries keep the PAT secret in memory so an expired or revoked token can
+    be replaced without the browser. Superseded tokens stay mapped to their
+    entry, so callers still holding one are switched to the current token.
+    """
+    def __init__(self, max_entries, margin):
+        self.max_entries = max_entries
+        self.margin = margin
+        self._entries = OrderedDict()
+        self._by_token = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+    
+    def _fresh(self, entry):
+        return entry is not None and entry['expiresAt'] - self.margin > time.time()
+    
+    def _creds(self, entry):
+        return {key: entry[key] for key in ('token', 'siteId', 'userId')}
+    
+    def sign_in(self, server, token_name, token_secret, site=''):
+        """Return cached credentials for the PAT, signing in if there are none"""
+        key = (server, site, token_name)
+        secret_hash = hashlib.sha256(token_secret.encode()).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if self._fresh(entry) and entry['secretHash'] == secret_hash:
+                self._entries.move_to_end(key)
+                return self._creds(entry)
+        return self._sign_in(key, token_secret)
+    
+    def _sign_in(self, key, token_secret, stale_token=None):
+        secret_hash = hashlib.sha256(token_secret.encode()).hexdigest()
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if stale_token and self._fresh(entry) and entry['token'] != stale_token:
+                    # Another caller already replaced the stale token
+                    return self._creds(entry)
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight[key] = threading.Event()
+            
+            if not leader:
+                event.wait()
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if self._fresh(entry) and entry['secretHash'] == secret_hash:
+                        return self._creds(entry)
+                continue
+            
+            try:
+                server, site, token_name = key
+                creds = sign_in(server, token_name, token_secret, site)
+                expires_in = creds.pop('expiresIn', None)
+                entry = dict(creds, secret=token_secret, secretHash=secret_hash,
+                             expiresAt=time.time() + (expires_in or 3600))
+                with self._lock:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    self._by_token[entry['token']] = key
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                    while len(self._by_token) > self.max_entries * 4:
+                        self._by_token.popitem(last=False)
+                return self._creds(entry)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+    
+    def current(self, headers):
+        """Swap a superseded token in headers for its entry's current token"""
+        token = headers.get('X-Tableau-Auth')
+        if not token:
+            return
+        with self._lock:
+            entry = self._entries.get(self._by_token.get(token))
+            if entry is not None and entry['token'] != token:
+                headers['X-Tableau-Auth'] = entry['token']
+    
+    def renew(self, headers):
+        """Sign in again for the token in headers after a 401; True if headers now hold a new token"""
+        token = headers.get('X-Tableau-Auth')
+        with self._lock:
+            key = self._by_token.get(token)
+            entry = self._entries.get(key)
+        if entry is None:
+            # Not a token this server signed in for, so there's no secret to reuse
+            return False
+        try:
+            creds = self._sign_in(key, entry['secret'], stale_token=token)
+        except (TableauError, requests.exceptions.RequestException) as e:
+            app.logger.warning(f"Automatic re-sign-in failed: {e}")
+            return False
+        headers['X-Tableau-Auth'] = creds['token']
+        return creds['token'] != token
+    
+    def forget(self, token):
+        """Drop the entry a token belongs to, e.g. after signing it out"""
+        with self._lock:
+            key = self._by_token.pop(token, None)
+            entry = self._entries.get(key)
+            if entry is not None and entry['token'] == token:
+                del self._entries[key]
+
+_tokens = TokenStore(TOKEN_CACHE_SIZE, TOKEN_EXPIRY_MARGIN)
+
+def tableau_call(server, method, url, **kwargs):
+    """Send a Tableau REST call through the server's pooled session.
+
+    A superseded token is swapped for the current one, and a 401 signs in
+    again and replays the call once. The headers dict is updated in place, so
+    later calls made with it carry the new token straight away.
+    """
+    headers = kwargs.get('headers')
+    if headers:
+        _tokens.current(headers)
+    resp = tableau_session(server).request(method, url, **kwargs)
+    if resp.status_code == 401 and headers and _tokens.renew(headers):
+        resp = tableau_session(server).request(method, url, **kwargs)
+    return resp
+
+def tableau_request(server, method, url, **kwargs):
+    """Send a Tableau REST call through the server's pooled session and adaptive limiter"""
+    limiter = server_limiter(server)
+    limiter.acquire()
+    status_code = retry_after = None
+    try:
+        resp = tableau_call(server, method, url, **kwargs)
+        status_code = resp.status_code
+        retry_after = retry_after_seconds(resp)
+        return resp
+    finally:
+        limiter.release(status_code, retry_after)
+
 # Enhanced HTML template with modern UI/UX and advanced filtering
 HTML_TEMPLATE = r'''
 <!DOCTYPE html>
@@ -215,6 +669,10 @@ HTML_TEMPLATE = r'''
                 <h2 class="text-2xl font-bold text-gray-900">Workbook Management</h2>
               </div>
               <div class="flex space-x-3">
+                <button id="reloadButton" class="px-6 py-2 bg-blue-500 text-white rounded-xl hover:bg-blue-600 transition-colors hover-lift">
+                  <i data-feather="rotate-cw" class="inline-block w-4 h-4 mr-2"></i>
+                  Reload
+                </button>
                 <button id="selectAllButton" class="px-6 py-2 bg-green-500 text-white rounded-xl hover:bg-green-600 transition-colors hover-lift">
                   <i data-feather="check-square" class="inline-block w-4 h-4 mr-2"></i>
                   Select All
@@ -277,6 +735,33 @@ HTML_TEMPLATE = r'''
               Export List
             </button>
           </div>
+          <label class="flex items-center text-sm text-gray-600 mt-4 cursor-pointer">
+            <input type="checkbox" id="sharedDatasources" class="mr-2">
+            Refresh shared published data sources once instead of every workbook that uses them
+          </label>
+          <label class="flex items-center text-sm text-gray-600 mt-2 cursor-pointer">
+            <input type="checkbox" id="admissionControl" class="mr-2">
+            Hold submissions while the site's extract refresh queue is busy
+          </label>
+          <label class="flex items-center text-sm text-gray-600 mt-2">
+            Refresh type
+            <select id="refreshType" class="input-field ml-2 p-1 rounded-lg focus:outline-none">
+              <option value="full">Full</option>
+              <option value="auto">Incremental where configured, else full</option>
+              <option value="incremental">Incremental</option>
+            </select>
+          </label>
+
+          <!-- Refresh Progress -->
+          <div id="refreshProgress" class="hidden mt-6">
+            <div class="flex justify-between text-sm text-gray-600 mb-2">
+              <span id="refreshProgressText">0 / 0 submitted</span>
+              <span><span id="refreshSuccessCount" class="text-green-600 font-semibold">0</span> succeeded · <span id="refreshFailCount" class="text-red-600 font-semibold">0</span> failed</span>
+            </div>
+            <div class="w-full bg-gray-200 rounded-full h-3">
+              <div id="refreshProgressBar" class="bg-green-500 h-3 rounded-full transition-all duration-300" style="width: 0%"></div>
+            </div>
+          </div>
         </div>
       </div>
 
@@ -302,26 +787,89 @@ HTML_TEMPLATE = r'''
     let server = '', siteId = '', authToken = '';
     let allWorkbooks = [];
     let filteredWorkbooks = [];
+    // Version of the loaded catalog, sent back as If-None-Match on the next fetch
+    let catalogEtag = null;
+    // Lookups kept alongside allWorkbooks so selection, stats and logging stay O(1)
+    const workbookById = new Map();
+    const searchTextById = new Map();
+    const selectedIds = new Set();
+    let projectNames = new Set(), ownerNames = new Set();
+    // allWorkbooks sorted by each sort option, built on first use and dropped
+    // whenever the catalog changes, so filtering never has to re-sort
+    let sortedWorkbooks = {};
+
+    // Virtualized list: only rows near the viewport are in the DOM
+    const PROJECT_ROW_HEIGHT = 64;
+    const CARD_ROW_HEIGHT = 152;
+    const OVERSCAN_PX = 600;
+    let rows = [], rowOffsets = [], columns = 1, renderedRange = '';
+    const collator = new Intl.Collator();
 
     // Utility functions
     function logMessage(message, type = 'info') {
       const log = document.getElementById('log');
       const timestamp = new Date().toLocaleTimeString();
       const icon = type === 'success' ? '✅' : type === 'error' ? '❌' : 'ℹ️';
-      log.innerHTML += `[${timestamp}] ${icon} ${message}\n`;
+      // Append one line as text: re-parsing the whole log per line is quadratic,
+      // and names and Tableau errors must not be read as HTML
+      const line = document.createElement('div');
+      line.textContent = `[${timestamp}] ${icon} ${message}`;
+      log.appendChild(line);
       log.scrollTop = log.scrollHeight;
     }
 
+    function escapeHtml(text) {
+      return String(text ?? '').replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'})[c]);
+    }
+
+    function icon(name, className) {
+      return feather.icons[name].toSvg({class: className});
+    }
+
+    function resetWorkbooks() {
+      allWorkbooks = [];
+      filteredWorkbooks = [];
+      workbookById.clear();
+      searchTextById.clear();
+      selectedIds.clear();
+      projectNames = new Set();
+      ownerNames = new Set();
+      sortedWorkbooks = {};
+    }
+
+    // Replace the loaded catalog, keeping the selection of workbooks that remain
+    function replaceWorkbooks(workbooks) {
+      const selected = [...selectedIds];
+      resetWorkbooks();
+      addWorkbooks(workbooks);
+      selected.forEach(id => { if (workbookById.has(id)) selectedIds.add(id); });
+    }
+
+    function addWorkbooks(workbooks) {
+      sortedWorkbooks = {};
+      workbooks.forEach(wb => {
+        allWorkbooks.push(wb);
+        workbookById.set(wb.id, wb);
+        searchTextById.set(wb.id, `${wb.name}\n${wb.project}\n${wb.owner}`.toLowerCase());
+        projectNames.add(wb.project);
+        ownerNames.add(wb.owner);
+      });
+    }
+
     function updateStats() {
-      const totalWorkbooks = allWorkbooks.length;
-      const selectedCount = document.querySelectorAll('.workbookCheckbox:checked').length;
-      const projectCount = new Set(allWorkbooks.map(wb => wb.project)).size;
-      const ownerCount = new Set(allWorkbooks.map(wb => wb.owner)).size;
+      document.getElementById('totalWorkbooks').textContent = allWorkbooks.length;
+      document.getElementById('selectedCount').textContent = selectedIds.size;
+      document.getElementById('projectCount').textContent = projectNames.size;
+      document.getElementById('ownerCount').textContent = ownerNames.size;
+    }
 
-      document.getElementById('totalWorkbooks').textContent = totalWorkbooks;
-      document.getElementById('selectedCount').textContent = selectedCount;
-      document.getElementById('projectCount').textContent = projectCount;
-      document.getElementById('ownerCount').textContent = ownerCount;
+    function updateRefreshProgress(successCount, failCount, total) {
+      const done = successCount + failCount;
+      document.getElementById('refreshProgress').classList.remove('hidden');
+      document.getElementById('refreshProgressText').textContent = `${done} / ${total} submitted`;
+      document.getElementById('refreshSuccessCount').textContent = successCount;
+      document.getElementById('refreshFailCount').textContent = failCount;
+      document.getElementById('refreshProgressBar').style.width = `${total ? Math.round(done / total * 100) : 0}%`;
     }
 
     function populateFilters() {
@@ -333,8 +881,8 @@ HTML_TEMPLATE = r'''
       ownerFilter.innerHTML = '<option value="">All Owners</option>';
       
       // Get unique values
-      const projects = [...new Set(allWorkbooks.map(wb => wb.project))].sort();
-      const owners = [...new Set(allWorkbooks.map(wb => wb.owner))].sort();
+      const projects = [...projectNames].sort();
+      const owners = [...ownerNames].sort();
       
       projects.forEach(project => {
         const option = document.createElement('option');
@@ -357,11 +905,25 @@ HTML_TEMPLATE = r'''
       const ownerFilter = document.getElementById('ownerFilter').value;
       const sortBy = document.getElementById('sortBy').value;
 
-      filteredWorkbooks = allWorkbooks.filter(wb => {
-        const matchesSearch = !searchTerm || 
-          wb.name.toLowerCase().includes(searchTerm) ||
-          wb.project.toLowerCase().includes(searchTerm) ||
-          wb.owner.toLowerCase().includes(searchTerm);
+      if (!sortedWorkbooks[sortBy]) {
+        // Sort workbooks (ISO timestamps compare correctly as strings)
+        const byDate = field => (a, b) => (b[field] || '') < (a[field] || '') ? -1 : (b[field] || '') > (a[field] || '') ? 1 : 0;
+        sortedWorkbooks[sortBy] = [...allWorkbooks].sort((a, b) => {
+          switch(sortBy) {
+            case 'name_desc': return collator.compare(b.name, a.name);
+            case 'project': return collator.compare(a.project, b.project) || collator.compare(a.name, b.name);
+            case 'owner': return collator.compare(a.owner, b.owner) || collator.compare(a.name, b.name);
+            case 'updated': return byDate('updatedAt')(a, b);
+            case 'created': return byDate('createdAt')(a, b);
+            default: return collator.compare(a.name, b.name);
+          }
+        });
+      }
+
+      // Filtering the presorted list keeps it in order
+      const sorted = sortedWorkbooks[sortBy];
+      filteredWorkbooks = !searchTerm && !projectFilter && !ownerFilter ? sorted : sorted.filter(wb => {
+        const matchesSearch = !searchTerm || searchTextById.get(wb.id).includes(searchTerm);
         
         const matchesProject = !projectFilter || wb.project === projectFilter;
         const matchesOwner = !ownerFilter || wb.owner === ownerFilter;
@@ -369,18 +931,6 @@ HTML_TEMPLATE = r'''
         return matchesSearch && matchesProject && matchesOwner;
       });
 
-      // Sort workbooks
-      filteredWorkbooks.sort((a, b) => {
-        switch(sortBy) {
-          case 'name_desc': return b.name.localeCompare(a.name);
-          case 'project': return a.project.localeCompare(b.project) || a.name.localeCompare(b.name);
-          case 'owner': return a.owner.localeCompare(b.owner) || a.name.localeCompare(b.name);
-          case 'updated': return new Date(b.updatedAt || 0) - new Date(a.updatedAt || 0);
-          case 'created': return new Date(b.createdAt || 0) - new Date(a.createdAt || 0);
-          default: return a.name.localeCompare(b.name);
-        }
-      });
-
       displayWorkbooks();
       updateActiveFilters();
     }
@@ -401,107 +951,180 @@ HTML_TEMPLATE = r'''
     function addFilterBadge(container, label, value, clearFunc) {
       const badge = document.createElement('div');
       badge.className = 'filter-badge bg-blue-500 text-white px-3 py-1 rounded-full text-sm flex items-center cursor-pointer';
-      badge.innerHTML = `${label}: ${value} <i data-feather="x" class="w-4 h-4 ml-2"></i>`;
+      badge.innerHTML = `${label}: ${escapeHtml(value)} ${icon('x', 'w-4 h-4 ml-2')}`;
       badge.onclick = () => { clearFunc(); applyFilters(); };
       container.appendChild(badge);
-      feather.replace();
     }
 
     function displayWorkbooks() {
       const container = document.getElementById('workbookList');
-      container.innerHTML = '';
+      rows = [];
+      rowOffsets = [];
+      renderedRange = '';
       
       if (filteredWorkbooks.length === 0) {
         container.innerHTML = `
           <div class="text-center py-12 text-gray-500">
-            <i data-feather="inbox" class="w-16 h-16 mx-auto mb-4 opacity-50"></i>
+            ${icon('inbox', 'w-16 h-16 mx-auto mb-4 opacity-50')}
             <p class="text-xl mb-2">No workbooks found</p>
             <p class="text-gray-400">Try adjusting your filters or search terms</p>
           </div>
         `;
-        feather.replace();
+        updateStats();
         return;
       }
 
       // Group by project
-      const projectGroups = {};
+      const projectGroups = new Map();
       filteredWorkbooks.forEach(wb => {
-        if (!projectGroups[wb.project]) {
-          projectGroups[wb.project] = [];
+        if (!projectGroups.has(wb.project)) {
+          projectGroups.set(wb.project, []);
         }
-        projectGroups[wb.project].push(wb);
+        projectGroups.get(wb.project).push(wb);
       });
 
-      Object.keys(projectGroups).sort().forEach(projectName => {
-        const projectDiv = document.createElement('div');
-        projectDiv.className = 'bg-white/90 rounded-2xl p-6 mb-4';
-        
-        const projectHeader = document.createElement('div');
-        projectHeader.className = 'flex items-center justify-between mb-4';
+      // Flatten into fixed-height rows: a header per project, then rows of cards
+      columns = container.clientWidth >= 640 ? 2 : 1;
+      let height = 0;
+      [...projectGroups.keys()].sort().forEach(projectName => {
+        const group = projectGroups.get(projectName);
+        rows.push({type: 'project', name: projectName, workbooks: group});
+        rowOffsets.push(height);
+        height += PROJECT_ROW_HEIGHT;
+        for (let i = 0; i < group.length; i += columns) {
+          rows.push({type: 'workbooks', workbooks: group.slice(i, i + columns)});
+          rowOffsets.push(height);
+          height += CARD_ROW_HEIGHT;
+        }
+      });
+      
+      container.innerHTML = '';
+      const spacer = document.createElement('div');
+      spacer.id = 'workbookSpacer';
+      spacer.style.position = 'relative';
+      spacer.style.height = `${height}px`;
+      container.appendChild(spacer);
+      
+      renderVisibleRows();
+      updateStats();
+    }
+
+    function renderVisibleRows(force = false) {
+      const container = document.getElementById('workbookList');
+      const spacer = document.getElementById('workbookSpacer');
+      if (!spacer || rows.length === 0) return;
+      
+      // Binary search for the last row starting above the overscan window
+      const top = container.scrollTop - OVERSCAN_PX;
+      const bottom = container.scrollTop + container.clientHeight + OVERSCAN_PX;
+      let first = 0, hi = rows.length - 1;
+      while (first < hi) {
+        const mid = (first + hi + 1) >> 1;
+        if (rowOffsets[mid] <= top) first = mid; else hi = mid - 1;
+      }
+      let last = first;
+      while (last + 1 < rows.length && rowOffsets[last + 1] < bottom) last++;
+      
+      const range = `${first}:${last}`;
+      if (!force && range === renderedRange) return;
+      renderedRange = range;
+      
+      const fragment = document.createDocumentFragment();
+      for (let i = first; i <= last; i++) {
+        fragment.appendChild(renderRow(rows[i], rowOffsets[i]));
+      }
+      spacer.replaceChildren(fragment);
+    }
+
+    function renderRow(row, offset) {
+      const el = document.createElement('div');
+      el.style.position = 'absolute';
+      el.style.left = '0';
+      el.style.right = '0';
+      el.style.top = `${offset}px`;
+      
+      if (row.type === 'project') {
+        el.style.height = `${PROJECT_ROW_HEIGHT}px`;
+        el.className = 'flex items-center justify-between px-2';
         
         const projectTitle = document.createElement('h3');
-        projectTitle.className = 'font-bold text-xl text-gray-800 flex items-center';
-        projectTitle.innerHTML = `<i data-feather="folder" class="w-5 h-5 mr-2"></i> ${projectName} <span class="ml-2 bg-blue-100 text-blue-800 px-3 py-1 rounded-full text-sm">${projectGroups[projectName].length}</span>`;
-        
-        const projectActions = document.createElement('div');
-        projectActions.className = 'flex space-x-2';
+        projectTitle.className = 'font-bold text-xl text-gray-800 flex items-center truncate';
+        projectTitle.innerHTML = `${icon('folder', 'w-5 h-5 mr-2 flex-shrink-0')} ${escapeHtml(row.name)} <span class="ml-2 bg-blue-100 text-blue-800 px-3 py-1 rounded-full text-sm">${row.workbooks.length}</span>`;
         
         const selectProjectBtn = document.createElement('button');
-        selectProjectBtn.className = 'px-4 py-2 bg-blue-500 text-white rounded-lg hover:bg-blue-600 transition-colors';
-        selectProjectBtn.innerHTML = '<i data-feather="check-square" class="w-4 h-4 mr-1"></i> Select All';
+        selectProjectBtn.className = 'px-4 py-2 bg-blue-500 text-white rounded-lg hover:bg-blue-600 transition-colors flex items-center flex-shrink-0';
+        selectProjectBtn.innerHTML = `${icon('check-square', 'w-4 h-4 mr-1')} Select All`;
         selectProjectBtn.onclick = () => {
-          projectDiv.querySelectorAll('.workbookCheckbox').forEach(cb => cb.checked = true);
+          row.workbooks.forEach(wb => selectedIds.add(wb.id));
+          renderVisibleRows(true);
           updateStats();
         };
         
-        projectActions.appendChild(selectProjectBtn);
-        projectHeader.appendChild(projectTitle);
-        projectHeader.appendChild(projectActions);
-        projectDiv.appendChild(projectHeader);
-        
-        const workbookGrid = document.createElement('div');
-        workbookGrid.className = 'grid md:grid-cols-2 gap-4';
-        
-        projectGroups[projectName].forEach(wb => {
-          const wbCard = document.createElement('div');
-          wbCard.className = 'workbook-card bg-gray-50 rounded-xl p-4 border-l-4';
-          
-          const checkbox = document.createElement('input');
-          checkbox.type = 'checkbox';
-          checkbox.value = wb.id;
-          checkbox.className = 'workbookCheckbox float-right mt-1';
-          checkbox.onchange = updateStats;
-          
-          const content = document.createElement('div');
-          content.className = 'pr-8';
-          
-          const name = document.createElement('div');
-          name.className = 'font-semibold text-gray-900 mb-2';
-          name.textContent = wb.name;
-          
-          const meta = document.createElement('div');
-          meta.className = 'text-sm text-gray-600 space-y-1';
-          meta.innerHTML = `
-            <div><i data-feather="user" class="w-4 h-4 inline mr-1"></i> ${wb.owner}</div>
-            ${wb.createdAt ? `<div><i data-feather="calendar" class="w-4 h-4 inline mr-1"></i> Created: ${new Date(wb.createdAt).toLocaleDateString()}</div>` : ''}
-            ${wb.updatedAt ? `<div><i data-feather="clock" class="w-4 h-4 inline mr-1"></i> Updated: ${new Date(wb.updatedAt).toLocaleDateString()}</div>` : ''}
-          `;
-          
-          content.appendChild(name);
-          content.appendChild(meta);
-          wbCard.appendChild(checkbox);
-          wbCard.appendChild(content);
-          workbookGrid.appendChild(wbCard);
-        });
-        
-        projectDiv.appendChild(workbookGrid);
-        container.appendChild(projectDiv);
-      });
+        el.appendChild(projectTitle);
+        el.appendChild(selectProjectBtn);
+        return el;
+      }
       
-      feather.replace();
-      updateStats();
+      el.style.height = `${CARD_ROW_HEIGHT - 16}px`;
+      el.style.display = 'grid';
+      el.style.gridTemplateColumns = `repeat(${columns}, minmax(0, 1fr))`;
+      el.style.gap = '1rem';
+      row.workbooks.forEach(wb => el.appendChild(renderCard(wb)));
+      return el;
+    }
+
+    function renderCard(wb) {
+      const wbCard = document.createElement('div');
+      wbCard.className = 'workbook-card bg-gray-50 rounded-xl p-4 border-l-4 overflow-hidden';
+      
+      const checkbox = document.createElement('input');
+      checkbox.type = 'checkbox';
+      checkbox.value = wb.id;
+      checkbox.className = 'workbookCheckbox float-right mt-1';
+      checkbox.checked = selectedIds.has(wb.id);
+      checkbox.onchange = () => {
+        if (checkbox.checked) selectedIds.add(wb.id); else selectedIds.delete(wb.id);
+        updateStats();
+      };
+      
+      const content = document.createElement('div');
+      content.className = 'pr-8';
+      
+      const name = document.createElement('div');
+      name.className = 'font-semibold text-gray-900 mb-2 truncate';
+      name.textContent = wb.name;
+      name.title = wb.name;
+      
+      const meta = document.createElement('div');
+      meta.className = 'text-sm text-gray-600 space-y-1';
+      meta.innerHTML = `
+        <div class="truncate">${icon('user', 'w-4 h-4 inline mr-1')} ${escapeHtml(wb.owner)}</div>
+        ${wb.createdAt ? `<div>${icon('calendar', 'w-4 h-4 inline mr-1')} Created: ${new Date(wb.createdAt).toLocaleDateString()}</div>` : ''}
+        ${wb.updatedAt ? `<div>${icon('clock', 'w-4 h-4 inline mr-1')} Updated: ${new Date(wb.updatedAt).toLocaleDateString()}</div>` : ''}
+      `;
+      
+      content.appendChild(name);
+      content.appendChild(meta);
+      wbCard.appendChild(checkbox);
+      wbCard.appendChild(content);
+      return wbCard;
     }
 
+    // Re-render visible rows on scroll, and re-layout when the column count changes
+    let scrollPending = false;
+    document.getElementById('workbookList').addEventListener('scroll', () => {
+      if (scrollPending) return;
+      scrollPending = true;
+      requestAnimationFrame(() => {
+        scrollPending = false;
+        renderVisibleRows();
+      });
+    });
+    window.addEventListener('resize', () => {
+      const container = document.getElementById('workbookList');
+      if (rows.length && (container.clientWidth >= 640 ? 2 : 1) !== columns) displayWorkbooks();
+    });
+
     // Event Listeners
     document.getElementById('authForm').addEventListener('submit', async (e) => {
       e.preventDefault();
@@ -530,8 +1153,9 @@ HTML_TEMPLATE = r'''
         
         authToken = data.token;
         siteId = data.siteId;
+        catalogKey = `${server}|${siteId}|${data.userId}`;
         logMessage('Authentication successful', 'success');
-        await fetchWorkbooks();
+        await loadWorkbooks();
         
       } catch (error) {
         logMessage(`Connection error: ${error.message}`, 'error');
@@ -542,55 +1166,261 @@ HTML_TEMPLATE = r'''
       }
     });
 
-    async function fetchWorkbooks() {
-      logMessage('Fetching workbooks...');
+    // Read a newline-delimited JSON response, calling onMessage for each line
+    async function readNdjson(res, onMessage) {
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+      }
+      if (buffer.trim()) onMessage(JSON.parse(buffer));
+    }
+
+    // Workbook fields the page uses, requested in the compact columnar format
+    const WORKBOOK_FIELDS = ['id', 'name', 'project', 'owner', 'createdAt', 'updatedAt', 'size'];
+
+    // Turn one columnar page back into workbook records. dictionaries
+    // accumulates across the pages of a stream, since each page only
+    // carries the entries it introduced.
+    function decodeColumnar(message, dictionaries) {
+      Object.entries(message.dictionaries || {}).forEach(([field, values]) => {
+        (dictionaries[field] = dictionaries[field] || []).push(...values);
+      });
+      const columns = Object.entries(message.columns).map(([field, column]) => {
+        const dict = dictionaries[field];
+        if (!dict) return [field, column];
+        if (field === 'tags') return [field, column.map(codes => codes.map(code => dict[code]))];
+        return [field, column.map(code => dict[code])];
+      });
+      const records = new Array(message.count);
+      for (let i = 0; i < message.count; i++) {
+        const wb = {};
+        for (const [field, column] of columns) wb[field] = column[i];
+        records[i] = wb;
+      }
+      return records;
+    }
+
+    // Browser-side catalog cache in IndexedDB, one entry per server, site and user
+    let catalogKey = null;
+
+    function catalogStore(mode, action) {
+      return new Promise((resolve, reject) => {
+        const open = indexedDB.open('tableau-mass-refresh', 1);
+        open.onupgradeneeded = () => open.result.createObjectStore('catalogs', {keyPath: 'key'});
+        open.onerror = () => reject(open.error);
+        open.onsuccess = () => {
+          const db = open.result;
+          const tx = db.transaction('catalogs', mode);
+          const req = action(tx.objectStore('catalogs'));
+          tx.oncomplete = () => { db.close(); resolve(req.result); };
+          tx.onerror = tx.onabort = () => { db.close(); reject(tx.error); };
+        };
+      });
+    }
+
+    async function loadStoredCatalog() {
+      if (!window.indexedDB || !catalogKey) return null;
       try {
+        return await catalogStore('readonly', store => store.get(catalogKey));
+      } catch (error) {
+        return null;
+      }
+    }
+
+    async function saveStoredCatalog() {
+      if (!window.indexedDB || !catalogKey) return;
+      try {
+        await catalogStore('readwrite', store => store.put({key: catalogKey, workbooks: allWorkbooks, etag: catalogEtag, savedAt: Date.now()}));
+      } catch (error) {
+        logMessage(`Could not cache the workbook list in the browser: ${error.message}`, 'error');
+      }
+    }
+
+    // Bring the loaded catalog up to date: fetch only workbooks updated since
+    // the newest one held, then, if the site's workbook count doesn't add up,
+    // fetch the current ids to find the deleted ones.
+    async function syncWorkbooks() {
+      const since = allWorkbooks.reduce((newest, wb) => (wb.updatedAt || '') > newest ? wb.updatedAt : newest, '');
+      const merged = new Map(allWorkbooks.map(wb => [wb.id, wb]));
+      let updated = 0, removed = 0;
+      
+      const fetchDelta = async withIds => {
         const res = await fetch('/api/workbooks', {
           method: 'POST',
           headers: {'Content-Type': 'application/json'},
-          body: JSON.stringify({server, siteId, token: authToken})
+          body: JSON.stringify({server, siteId, token: authToken, since, ids: withIds, format: 'columnar', fields: WORKBOOK_FIELDS})
         });
-        
         const data = await res.json();
-        if (data.error) {
-          logMessage(`Failed to fetch workbooks: ${data.error}`, 'error');
+        if (!res.ok) throw new Error(data.error);
+        decodeColumnar(data, {}).forEach(wb => {
+          if (merged.get(wb.id)?.updatedAt !== wb.updatedAt) updated++;
+          merged.set(wb.id, wb);
+        });
+        return data;
+      };
+      
+      let delta = await fetchDelta(false);
+      if (merged.size !== delta.total) {
+        delta = await fetchDelta(true);
+        // Workbooks can become visible without a newer updatedAt (a permission
+        // grant, say); the delta can't return them, so the caller refetches
+        if (delta.ids.some(id => !merged.has(id))) return null;
+        const current = new Set(delta.ids);
+        [...merged.keys()].forEach(id => {
+          if (!current.has(id)) {
+            merged.delete(id);
+            removed++;
+          }
+        });
+      }
+      return {updated, removed, workbooks: [...merged.values()]};
+    }
+
+    // Show the catalog cached in the browser at once, then apply what changed
+    // on the site since; without a cached copy, fetch the full list.
+    async function loadWorkbooks() {
+      const stored = await loadStoredCatalog();
+      if (!stored || !stored.workbooks.length) {
+        await fetchWorkbooks();
+        return;
+      }
+      
+      resetWorkbooks();
+      addWorkbooks(stored.workbooks);
+      catalogEtag = stored.etag;
+      document.getElementById('workbookSection').classList.remove('hidden');
+      document.getElementById('statsSection').classList.remove('hidden');
+      populateFilters();
+      applyFilters();
+      logMessage(`Loaded ${allWorkbooks.length} workbooks from the browser cache, checking for changes...`);
+      
+      try {
+        const delta = await syncWorkbooks();
+        if (!delta) {
+          logMessage('Workbooks without recent changes were added, fetching the full list');
+          await fetchWorkbooks();
           return;
         }
+        if (delta.updated || delta.removed) {
+          replaceWorkbooks(delta.workbooks);
+          // The server's version tag no longer describes this merged list
+          catalogEtag = null;
+          populateFilters();
+          applyFilters();
+          await saveStoredCatalog();
+        }
+        logMessage(`Workbook list synced: ${delta.updated} added or updated, ${delta.removed} removed (${allWorkbooks.length} workbooks)`, 'success');
+      } catch (error) {
+        logMessage(`Sync failed (${error.message}), fetching the full list`, 'error');
+        await fetchWorkbooks();
+      }
+    }
+
+    // Coalesce re-renders while pages are streaming in
+    let renderPending = false;
+    function scheduleRender() {
+      if (renderPending) return;
+      renderPending = true;
+      requestAnimationFrame(() => {
+        renderPending = false;
+        applyFilters();
+      });
+    }
+
+    async function fetchWorkbooks(reload = false) {
+      logMessage(reload ? 'Checking for workbook changes...' : 'Fetching workbooks...');
+      try {
+        const headers = {'Content-Type': 'application/json'};
+        if (catalogEtag && allWorkbooks.length) headers['If-None-Match'] = `W/"${catalogEtag}"`;
+        const res = await fetch('/api/workbooks', {
+          method: 'POST',
+          headers,
+          body: JSON.stringify({server, siteId, token: authToken, stream: true, format: 'columnar', fields: WORKBOOK_FIELDS, noCache: reload})
+        });
         
-        allWorkbooks = data.workbooks;
-        filteredWorkbooks = [...allWorkbooks];
+        if (res.status === 304) {
+          logMessage(`Workbook list is up to date (${allWorkbooks.length} workbooks)`, 'success');
+          return;
+        }
         
-        populateFilters();
-        displayWorkbooks();
+        if (!res.ok) {
+          const data = await res.json();
+          logMessage(`Failed to fetch workbooks: ${data.error}`, 'error');
+          return;
+        }
         
+        resetWorkbooks();
         document.getElementById('workbookSection').classList.remove('hidden');
         document.getElementById('statsSection').classList.remove('hidden');
         
+        let streamError = null;
+        const dictionaries = {};
+        catalogEtag = null;
+        await readNdjson(res, message => {
+          if (message.error) {
+            streamError = message.error;
+          } else if (message.done) {
+            catalogEtag = message.etag;
+          } else if (message.columns) {
+            addWorkbooks(decodeColumnar(message, dictionaries));
+            scheduleRender();
+          } else if (message.workbooks) {
+            addWorkbooks(message.workbooks);
+            scheduleRender();
+          }
+        });
+        
+        if (streamError) {
+          logMessage(`Failed to fetch workbooks: ${streamError}`, 'error');
+          return;
+        }
+        
+        populateFilters();
+        applyFilters();
+        
         logMessage(`Successfully loaded ${allWorkbooks.length} workbooks`, 'success');
+        await saveStoredCatalog();
         
       } catch (error) {
         logMessage(`Error fetching workbooks: ${error.message}`, 'error');
       }
     }
 
-    // Filter event listeners
-    ['searchInput', 'projectFilter', 'ownerFilter', 'sortBy'].forEach(id => {
+    // Filter event listeners; typing is debounced so a fast typist filters once
+    const SEARCH_DEBOUNCE_MS = 150;
+    let searchTimer = null;
+    document.getElementById('searchInput').addEventListener('input', () => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(applyFilters, SEARCH_DEBOUNCE_MS);
+    });
+    ['projectFilter', 'ownerFilter', 'sortBy'].forEach(id => {
       document.getElementById(id).addEventListener('input', applyFilters);
     });
 
+    document.getElementById('reloadButton').addEventListener('click', () => fetchWorkbooks(true));
+
     document.getElementById('selectAllButton').addEventListener('click', () => {
-      document.querySelectorAll('.workbookCheckbox').forEach(cb => cb.checked = true);
+      filteredWorkbooks.forEach(wb => selectedIds.add(wb.id));
+      renderVisibleRows(true);
       updateStats();
     });
 
     document.getElementById('clearAllButton').addEventListener('click', () => {
-      document.querySelectorAll('.workbookCheckbox').forEach(cb => cb.checked = false);
+      selectedIds.clear();
+      renderVisibleRows(true);
       updateStats();
     });
 
     document.getElementById('refreshButton').addEventListener('click', async () => {
-      const selectedIds = Array.from(document.querySelectorAll('.workbookCheckbox:checked')).map(el => el.value);
-      if (selectedIds.length === 0) {
+      const refreshIds = [...selectedIds];
+      if (refreshIds.length === 0) {
         logMessage('Please select at least one workbook to refresh', 'error');
         return;
       }
@@ -600,30 +1430,77 @@ HTML_TEMPLATE = r'''
       btn.innerHTML = '<i data-feather="loader" class="inline-block w-5 h-5 mr-2 animate-spin"></i> Refreshing...';
       btn.disabled = true;
       
-      logMessage(`Starting refresh of ${selectedIds.length} workbooks...`);
+      logMessage(`Starting refresh of ${refreshIds.length} workbooks...`);
       
       try {
+        let plan = null;
+        if (document.getElementById('sharedDatasources').checked) {
+          const planRes = await fetch('/api/refresh/plan', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({server, siteId, token: authToken, workbookIds: refreshIds})
+          });
+          plan = await planRes.json();
+          if (plan.error) {
+            logMessage(`Refresh planning failed: ${plan.error}`, 'error');
+            return;
+          }
+          logMessage(`Refresh plan: ${plan.datasources.length} data sources + ${plan.workbookIds.length} workbooks = ${plan.jobsPlanned} jobs instead of ${plan.jobsWithoutPlan} (${plan.jobsSaved} saved, ${plan.skipped.length} skipped)`);
+          plan.skipped.forEach(item => {
+            logMessage(`Skipped ${workbookById.get(item.id)?.name || item.id}: ${item.reason}`);
+          });
+        }
+        const total = plan ? plan.jobsPlanned : refreshIds.length;
+        const sizes = {};
+        refreshIds.forEach(id => {
+          const workbook = workbookById.get(id);
+          if (workbook && workbook.size) sizes[id] = workbook.size;
+        });
+        
         const res = await fetch('/api/refresh', {
           method: 'POST',
           headers: {'Content-Type': 'application/json'},
-          body: JSON.stringify({server, siteId, token: authToken, workbookIds: selectedIds})
+          body: JSON.stringify({server, siteId, token: authToken, workbookIds: refreshIds, plan, sizes, stream: true,
+            admission: document.getElementById('admissionControl').checked,
+            refreshType: document.getElementById('refreshType').value})
         });
         
-        const results = await res.json();
-        const successCount = results.filter(r => r.success).length;
-        const failCount = results.length - successCount;
+        if (!res.ok) {
+          const data = await res.json();
+          logMessage(`Refresh error: ${data.error}`, 'error');
+          return;
+        }
+        
+        let successCount = 0, failCount = 0, batchId = null;
+        updateRefreshProgress(successCount, failCount, total);
         
-        results.forEach(result => {
-          const workbook = allWorkbooks.find(wb => wb.id === result.id);
-          const name = workbook ? workbook.name : result.id;
+        // Each line is one workbook's result, sent as soon as its POST completes
+        await readNdjson(res, result => {
+          if (result.done) {
+            batchId = result.batchId;
+            if (result.schedule) {
+              const finishAt = new Date(result.schedule.predictedFinishAt).toLocaleTimeString();
+              logMessage(`Predicted finish: ${finishAt} (${formatDuration(result.schedule.makespanSeconds)} on ${result.schedule.slots} backgrounders)`);
+            }
+            return;
+          }
+          const workbook = workbookById.get(result.id);
+          const name = result.type === 'datasource'
+            ? `data source ${result.name || result.id} (used by ${result.workbookIds.length} selected workbooks)`
+            : workbook ? workbook.name : result.id;
+          const retries = result.retries ? ` (after ${result.retries} ${result.retries === 1 ? 'retry' : 'retries'})` : '';
           if (result.success) {
-            logMessage(`Successfully refreshed: ${name}`, 'success');
+            successCount++;
+            logMessage(`Successfully refreshed: ${name}${retries}`, 'success');
           } else {
-            logMessage(`Failed to refresh ${name}: ${result.error || 'Unknown error'}`, 'error');
+            failCount++;
+            logMessage(`Failed to refresh ${name}: ${result.error || 'Unknown error'}${retries}`, 'error');
           }
+          updateRefreshProgress(successCount, failCount, total);
         });
         
-        logMessage(`Refresh completed: ${successCount} successful, ${failCount} failed`, successCount === results.length ? 'success' : 'error');
+        logMessage(`Refresh completed: ${successCount} successful, ${failCount} failed`, failCount === 0 ? 'success' : 'error');
+        if (batchId && successCount > 0) watchBatch(batchId);
         
       } catch (error) {
         logMessage(`Refresh error: ${error.message}`, 'error');
@@ -634,41 +1511,75 @@ HTML_TEMPLATE = r'''
       }
     });
 
+    function formatDuration(seconds) {
+      if (seconds == null) return '';
+      const m = Math.floor(seconds / 60), s = seconds % 60;
+      return m ? `${m}m ${s}s` : `${s}s`;
+    }
+
+    // Follow a refresh batch's jobs through the server-side watcher
+    function watchBatch(batchId) {
+      const params = new URLSearchParams({server, siteId, token: authToken});
+      const source = new EventSource(`/api/batches/${batchId}/events?${params}`);
+      logMessage('Tracking refresh jobs...');
+      
+      source.addEventListener('job', e => {
+        const event = JSON.parse(e.data);
+        const workbook = workbookById.get(event.workbookId);
+        const name = workbook ? workbook.name : event.workbookId;
+        if (event.to === 'InProgress') {
+          const queued = event.queuedSeconds != null ? ` after ${formatDuration(event.queuedSeconds)} queued` : '';
+          logMessage(`Extract refresh running: ${name}${queued}`);
+        } else if (event.to === 'Success') {
+          const took = event.runSeconds != null ? ` in ${formatDuration(event.runSeconds)}` : '';
+          logMessage(`Extract refresh finished: ${name}${took}`, 'success');
+        } else if (event.to !== 'Pending') {
+          logMessage(`Extract refresh ${event.to.toLowerCase()}: ${name}`, 'error');
+        }
+      });
+      
+      source.addEventListener('done', e => {
+        source.close();
+        const counts = JSON.parse(e.data).counts;
+        const summary = Object.entries(counts).map(([status, n]) => `${n} ${status}`).join(', ');
+        logMessage(`Refresh jobs finished: ${summary}`, counts.Success === Object.values(counts).reduce((a, b) => a + b, 0) ? 'success' : 'error');
+      });
+    }
+
     document.getElementById('exportButton').addEventListener('click', () => {
-      const selectedWorkbooks = allWorkbooks.filter(wb => 
-        document.querySelector(`input[value="${wb.id}"]`)?.checked
-      );
+      const selectedWorkbooks = [...selectedIds].map(id => workbookById.get(id)).filter(Boolean);
       
       if (selectedWorkbooks.length === 0) {
         logMessage('No workbooks selected for export', 'error');
         return;
       }
       
-      const csvContent = [
-        ['Name', 'Project', 'Owner', 'Created', 'Updated', 'ID'].join(','),
-        ...selectedWorkbooks.map(wb => [
-          `"${wb.name}"`,
-          `"${wb.project}"`,
-          `"${wb.owner}"`,
-          wb.createdAt ? new Date(wb.createdAt).toLocaleDateString() : '',
-          wb.updatedAt ? new Date(wb.updatedAt).toLocaleDateString() : '',
-          wb.id
-        ].join(','))
-      ].join('\n');
-      
-      const blob = new Blob([csvContent], { type: 'text/csv' });
-      const url = URL.createObjectURL(blob);
-      const a = document.createElement('a');
-      a.href = url;
-      a.download = `tableau_workbooks_${new Date().toISOString().split('T')[0]}.csv`;
-      a.click();
-      URL.revokeObjectURL(url);
+      // A regular form POST lets the browser stream the server's CSV straight to disk
+      const form = document.createElement('form');
+      form.method = 'POST';
+      form.action = '/api/workbooks/export';
+      form.style.display = 'none';
+      const fields = {
+        server, siteId, token: authToken,
+        ids: selectedWorkbooks.map(wb => wb.id).join(','),
+        columns: 'name,project,owner,createdAt,updatedAt,id'
+      };
+      Object.entries(fields).forEach(([name, value]) => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value;
+        form.appendChild(input);
+      });
+      document.body.appendChild(form);
+      form.submit();
+      form.remove();
       
       logMessage(`Exported ${selectedWorkbooks.length} workbooks to CSV`, 'success');
     });
 
     document.getElementById('clearLogButton').addEventListener('click', () => {
-      document.getElementById('log').innerHTML = '';
+      document.getElementById('log').replaceChildren();
     });
   </script>
 </body>
@@ -685,31 +1596,12 @@ def signin():
     server = data.get('server','').rstrip('/')
     site = data.get('site','')
     
-    body = {
-        'credentials': {
-            'personalAccessTokenName': data.get('tokenName',''),
-            'personalAccessTokenSecret': data.get('tokenSecret',''),
-            'site': {'contentUrl': site}
-        }
-    }
-    
     try:
-        resp = requests.post(
-            f"{server}/api/3.17/auth/signin", 
-            json=body, 
-            headers={'Content-Type':'application/json','Accept':'application/json'},
-            timeout=30
-        )
-        
-        if resp.status_code != 200:
-            return jsonify(error=f"Sign-in failed ({resp.status_code}): {resp.text}"), resp.status_code
-            
-        creds = resp.json().get('credentials', {})
-        return jsonify(
-            token=creds.get('token'), 
-            siteId=creds.get('site',{}).get('id')
-        )
+        creds = _tokens.sign_in(server, data.get('tokenName',''), data.get('tokenSecret',''), site)
+        return jsonify(token=creds['token'], siteId=creds['siteId'], userId=creds['userId'])
         
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
     except requests.exceptions.RequestException as e:
         app.logger.error(f"Sign-in request failed: {e}")
         return jsonify(error=f"Connection failed: {str(e)}"), 500
@@ -717,87 +1609,2031 @@ def signin():
         app.logger.error(f"Sign-in error: {e}")
         return jsonify(error=f"Authentication error: {str(e)}"), 500
 
-@app.route('/api/workbooks', methods=['POST'])
-def workbooks():
-    data = request.json or {}
-    server = data.get('server','').rstrip('/')
-    token = data.get('token','')
-    siteId = data.get('siteId','')
+class TableauError(Exception):
+    """A non-success response from the Tableau REST API"""
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+def sign_in(server, token_name, token_secret, site=''):
+    """Sign in with a Personal Access Token; returns the token, site id and user id"""
+    body = {
+        'credentials': {
+            'personalAccessTokenName': token_name,
+            'personalAccessTokenSecret': token_secret,
+            'site': {'contentUrl': site}
+        }
+    }
+    resp = tableau_session(server).post(
+        f"{server}/api/3.17/auth/signin", 
+        json=body, 
+        headers={'Content-Type':'application/json','Accept':'application/json'},
+        timeout=30
+    )
     
-    headers = {
-        'X-Tableau-Auth': token, 
-        'Accept': 'application/json'
+    if resp.status_code != 200:
+        raise TableauError(f"Sign-in failed ({resp.status_code}): {resp.text}", resp.status_code)
+    
+    creds = resp.json().get('credentials', {})
+    return {
+        'token': creds.get('token'),
+        'siteId': creds.get('site', {}).get('id'),
+        'userId': creds.get('user', {}).get('id'),
+        'expiresIn': expiry_seconds(creds.get('estimatedTimeToExpiration'))
+    }
+
+def fetch_workbook_page(server, siteId, headers, page_number, page_size=WORKBOOK_PAGE_SIZE, sort=None, query_filter=None,
+                        fields='id,name,contentUrl,showTabs,size,createdAt,updatedAt,project,owner,tags'):
+    """Fetch one page of the site's workbooks and return the parsed body"""
+    url = f"{server}/api/3.17/sites/{siteId}/workbooks"
+    params = {
+        'pageSize': page_size,
+        'pageNumber': page_number,
+        'fields': fields
     }
+    if sort:
+        params['sort'] = sort
+    if query_filter:
+        params['filter'] = query_filter
+    
+    # Page reads are idempotent, so transient failures are simply retried
+    deadline = time.monotonic() + RETRY_BUDGET
+    attempt = 0
+    while True:
+        try:
+            resp = tableau_request(server, 'GET', url, headers=headers, params=params, timeout=30)
+            if resp.status_code not in RETRYABLE_STATUSES:
+                break
+            delay = retry_delay(attempt, deadline, retry_after_seconds(resp))
+            if delay is None:
+                break
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            delay = retry_delay(attempt, deadline)
+            if delay is None:
+                raise
+        app.logger.warning(f"Retrying workbooks page {page_number} in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+    
+    if resp.status_code != 200:
+        raise TableauError(f"Fetch workbooks failed ({resp.status_code}): {resp.text}", resp.status_code)
     
     try:
-        # Fetch workbooks with pagination support
-        all_workbooks = []
-        page_number = 1
-        page_size = 100
-        
-        while True:
-            url = f"{server}/api/3.17/sites/{siteId}/workbooks"
-            params = {
-                'pageSize': page_size,
-                'pageNumber': page_number,
-                'fields': 'id,name,createdAt,updatedAt,project,owner'
-            }
-            
-            resp = requests.get(url, headers=headers, params=params, timeout=30)
-            
-            if resp.status_code != 200:
-                return jsonify(error=f"Fetch workbooks failed ({resp.status_code}): {resp.text}"), resp.status_code
+        return resp.json()
+    except ValueError:
+        raise TableauError(f"Invalid JSON response: {resp.text}", 502)
+
+def iter_workbook_pages(server, siteId, headers, **query):
+    """Yield a site's workbooks one page at a time, in page order.
+
+    Pages after the first are fetched in parallel, at most CATALOG_CONCURRENCY
+    ahead of the consumer; each is yielded as soon as it and every page
+    before it have arrived. query (query_filter, fields) is passed on to
+    every page request.
+    """
+    first = fetch_workbook_page(server, siteId, headers, 1, **query)
+    first_page = first.get('workbooks', {}).get('workbook', [])
+    yield first_page
+    
+    # The server may cap pageSize below what we asked for, so page using its value
+    pagination = first.get('pagination', {})
+    total_available = int(pagination.get('totalAvailable', 0))
+    page_size = int(pagination.get('pageSize', 0)) or WORKBOOK_PAGE_SIZE
+    if not first_page or len(first_page) >= total_available:
+        return
+    
+    page_count = -(-total_available // page_size)
+    page_numbers = range(2, page_count + 1)
+    
+    def fetch(page_number):
+        body = fetch_workbook_page(server, siteId, headers, page_number, page_size, **query)
+        return body.get('workbooks', {}).get('workbook', [])
+    
+    window = max(1, min(CATALOG_CONCURRENCY, len(page_numbers)))
+    pool = ThreadPoolExecutor(max_workers=window)
+    try:
+        # Top the window up as each page is yielded, so a slow consumer holds
+        # at most `window` pages in memory; pages come out in page order
+        remaining = iter(page_numbers)
+        pending = deque(pool.submit(fetch, n) for n in islice(remaining, window))
+        while pending:
+            page = pending.popleft().result()
+            for n in islice(remaining, 1):
+                pending.append(pool.submit(fetch, n))
+            yield page
+    finally:
+        # Don't keep fetching if the consumer stopped early (e.g. client disconnect)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def fetch_all_workbooks(server, siteId, headers):
+    """Fetch every workbook on a site as one list"""
+    all_workbooks = []
+    for workbooks in iter_workbook_pages(server, siteId, headers):
+        all_workbooks.extend(workbooks)
+    return all_workbooks
+
+def workbook_info(wb):
+    """Convert a raw Tableau workbook record into the shape the UI uses"""
+    return {
+        'id': wb.get('id'),
+        'name': wb.get('name', 'Unknown'),
+        'project': wb.get('project', {}).get('name', 'Default'),
+        'owner': wb.get('owner', {}).get('name', 'Unknown'),
+        'createdAt': wb.get('createdAt'),
+        'updatedAt': wb.get('updatedAt'),
+        'size': wb.get('size'),
+        'contentUrl': wb.get('contentUrl'),
+        'showTabs': wb.get('showTabs', False),
+        'tags': [tag.get('label', '') for tag in wb.get('tags', {}).get('tag', [])]
+    }
+
+# Fields of a workbook_info() record, in order, for the columnar format
+WORKBOOK_FIELDS = ('id', 'name', 'project', 'owner', 'createdAt', 'updatedAt', 'size', 'contentUrl', 'showTabs', 'tags')
+# Low-cardinality fields sent as integer codes into a dictionary (tags as lists of codes)
+DICTIONARY_FIELDS = ('project', 'owner', 'tags')
+
+class ColumnarEncoder:
+    """Encodes workbook records as parallel column arrays for the compact format.
+
+    Dictionary fields are sent as integer codes. Codes are stable across
+    calls on one encoder, and each call only returns the dictionary entries
+    it added, so a stream of pages sends every project or owner name once.
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.codes = {field: {} for field in self.fields if field in DICTIONARY_FIELDS}
+
+    def encode(self, records):
+        """Return {"count", "columns", "dictionaries"} for a list of workbook_info() records"""
+        columns = {}
+        added = {}
+        for field in self.fields:
+            codes = self.codes.get(field)
+            if codes is None:
+                columns[field] = [wb.get(field) for wb in records]
+                continue
+
+            start = len(codes)
+            if field == 'tags':
+                columns[field] = [[codes.setdefault(tag, len(codes)) for tag in wb.get('tags') or []] for wb in records]
+            else:
+                columns[field] = [codes.setdefault(wb.get(field), len(codes)) for wb in records]
+            # Dicts keep insertion order, so new entries are the tail
+            added[field] = list(codes)[start:]
+        return {'count': len(records), 'columns': columns, 'dictionaries': added}
+
+def catalog_fields(data):
+    """Return the fields requested for the columnar format, or raise ValueError for unknown ones"""
+    fields = data.get('fields') or WORKBOOK_FIELDS
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in WORKBOOK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown workbook fields: {', '.join(map(str, unknown))}. Available: {', '.join(WORKBOOK_FIELDS)}")
+    # Drop duplicates, keep the caller's order
+    return tuple(dict.fromkeys(fields))
+
+def columnar_catalog(workbook_list, fields):
+    """Encode a whole catalog in the columnar format"""
+    body = {'format': 'columnar', 'fields': list(fields)}
+    body.update(ColumnarEncoder(fields).encode(workbook_list))
+    return body
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a fixed TTL.
+
+    Concurrent misses for the same key are coalesced: the first caller runs
+    the loader and the rest wait for its result (or its exception).
+    """
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, loader, force=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not force and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
             
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {'done': threading.Event()}
+        
+        if not leader:
+            flight['done'].wait()
+            if 'error' in flight:
+                raise flight['error']
+            return flight['value']
+        
+        try:
+            value = loader()
+            flight['value'] = value
+            self.put(key, value)
+            return value
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight['done'].set()
+    
+    def peek(self, key, stale=False):
+        """Return the live value for key without loading it, or None.
+
+        With stale=True an expired value that hasn't been evicted yet is
+        returned too.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (stale or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                return entry[1]
+            return None
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_catalog_cache = TTLCache(CATALOG_CACHE_TTL, CATALOG_CACHE_SIZE)
+_token_scopes = TTLCache(CATALOG_CACHE_TTL, 1024)
+
+def catalog_scope(server, siteId, headers):
+    """Verify the caller's token is signed in to siteId and return its cache key.
+
+    Tableau filters the catalog by the signed-in user's permissions, so
+    non-admin users get their own cache entry; administrators see the whole
+    site and share one.
+    """
+    token = headers.get('X-Tableau-Auth', '')
+    token_key = hashlib.sha256(f"{server}\0{siteId}\0{token}".encode()).hexdigest()
+    
+    def load():
+        resp = tableau_call(server, 'GET', f"{server}/api/3.17/sessions/current", headers=headers, timeout=30)
+        if resp.status_code != 200:
+            raise TableauError(f"Session check failed ({resp.status_code}): {resp.text}", resp.status_code)
+        
+        session = resp.json().get('session', {})
+        if session.get('site', {}).get('id') != siteId:
+            raise TableauError("Authentication token is not valid for this site", 403)
+        
+        user = session.get('user', {})
+        view = '*' if user.get('siteRole') in ADMIN_SITE_ROLES else user.get('id')
+        return (server, siteId, view)
+    
+    return _token_scopes.get(token_key, load)
+
+def catalog_head(server, siteId, headers):
+    """Return (workbook count, newest updatedAt) for a site, fetching a single workbook"""
+    body = fetch_workbook_page(server, siteId, headers, 1, page_size=1, sort='updatedAt:desc')
+    newest = body.get('workbooks', {}).get('workbook') or [{}]
+    return int(body.get('pagination', {}).get('totalAvailable', 0)), newest[0].get('updatedAt')
+
+def revalidate_catalog(scope, server, siteId, headers):
+    """Return the previously loaded catalog for scope if Tableau shows it is still current, else None.
+
+    A new or updated workbook moves the newest updatedAt and a deletion
+    lowers the count, so comparing the two catches changes without paging
+    through the whole site.
+    """
+    previous = _catalog_cache.peek(scope, stale=True)
+    if previous is None or not CATALOG_REVALIDATE:
+        return None
+    
+    newest = max((wb.get('updatedAt') or '' for wb in previous), default=None)
+    if catalog_head(server, siteId, headers) != (len(previous), newest or None):
+        return None
+    app.logger.info(f"Workbook catalog unchanged ({len(previous)} workbooks); reusing cached copy")
+    return previous
+
+def catalog_delta(scope, server, siteId, headers, since, with_ids=False, force=False):
+    """Return (workbooks updated at or after since, current workbook count, current ids or None).
+
+    A live cached catalog answers without calling Tableau. Otherwise only
+    the updated workbooks are fetched, using an updatedAt filter, and the
+    count comes from a one-workbook page. With with_ids, every current id
+    is listed too (fetching the id field alone), so a caller whose count
+    doesn't add up can find which workbooks were deleted.
+    """
+    cached = None if force else _catalog_cache.peek(scope)
+    if cached is not None:
+        updated = [wb for wb in cached if (wb.get('updatedAt') or '') >= since]
+        return updated, len(cached), [wb['id'] for wb in cached] if with_ids else None
+    
+    updated = []
+    for page in iter_workbook_pages(server, siteId, headers, query_filter=f"updatedAt:gte:{since}"):
+        updated.extend(workbook_info(wb) for wb in page)
+    
+    if not with_ids:
+        total, _ = catalog_head(server, siteId, headers)
+        return updated, total, None
+    
+    ids = [wb.get('id') for page in iter_workbook_pages(server, siteId, headers, fields='id') for wb in page]
+    return updated, len(ids), ids
+
+def load_catalog(scope, server, siteId, headers, force=False):
+    """Return the converted, name-sorted workbook list for a catalog scope"""
+    def load():
+        previous = revalidate_catalog(scope, server, siteId, headers)
+        if previous is not None:
+            return previous
+        
+        # Fetch workbooks with pagination support
+        all_workbooks = fetch_all_workbooks(server, siteId, headers)
+        
+        # Process workbooks with enhanced information
+        workbook_list = [workbook_info(wb) for wb in all_workbooks]
+        
+        # Sort workbooks by name for consistent ordering
+        workbook_list.sort(key=lambda x: x['name'].lower())
+        return workbook_list
+    
+    return _catalog_cache.get(scope, load, force=force)
+
+def dumps_json(obj):
+    """Encode obj as compact UTF-8 JSON bytes, using orjson when it's installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+def json_response(obj, status=200):
+    """jsonify() for large payloads: compact, unsorted and encoded by the fast path"""
+    return Response(dumps_json(obj), status=status, mimetype='application/json')
+
+def ndjson(obj):
+    """Encode one message of a newline-delimited JSON stream"""
+    return dumps_json(obj).decode() + '\n'
+
+def negotiate_encoding(accept_encoding):
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None for no compression"""
+    offered = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
             try:
-                body = resp.json()
+                quality = float(params.strip()[2:])
             except ValueError:
-                return jsonify(error=f"Invalid JSON response: {resp.text}"), 502
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    # Highest quality wins; on a tie prefer brotli, which is smaller
+    ranked = sorted(available, key=lambda name: offered.get(name, offered.get('*', 0.0)), reverse=True)
+    best = ranked[0]
+    return best if offered.get(best, offered.get('*', 0.0)) > 0 else None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+def compress_stream(chunks, encoding):
+    """Compress a streamed body, flushing after every chunk so nothing is held back"""
+    try:
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            for chunk in chunks:
+                yield compressor.process(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush()
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                yield compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+    finally:
+        # Pass a client disconnect on to the wrapped stream
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+_encoded_catalogs = TTLCache(CATALOG_CACHE_TTL, CATALOG_CACHE_SIZE)
+
+def catalog_version(workbook_list, version=0):
+    """Hash of a catalog's workbook ids and updatedAt stamps.
+
+    Each workbook's hash is XORed in, so the result doesn't depend on order
+    and can be built up a page at a time by passing the previous result.
+    """
+    for wb in workbook_list:
+        stamp = f"{wb.get('id')}\0{wb.get('updatedAt')}".encode()
+        version ^= int.from_bytes(hashlib.sha1(stamp).digest()[:10], 'big')
+    return version
+
+def catalog_entry(scope, workbook_list):
+    """Return the per-load cache of encoded bodies and the version for a catalog"""
+    # A stale entry is still right if it was built from this very list
+    entry = _encoded_catalogs.peek(scope, stale=True)
+    if entry is None or entry['source'] is not workbook_list:
+        entry = {'source': workbook_list, 'version': catalog_version(workbook_list)}
+    _encoded_catalogs.put(scope, entry)
+    return entry
+
+def catalog_etag(version, fields=None):
+    """ETag value for one representation (record or columnar projection) of a catalog version"""
+    if fields is None:
+        return f"{version:020x}"
+    return f"{version:020x}-{hashlib.sha1(','.join(fields).encode()).hexdigest()[:8]}"
+
+def not_modified(etag):
+    """Return a 304 response if the request's If-None-Match already names etag, else None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    resp = Response(status=304)
+    resp.set_etag(etag, weak=True)
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+def catalog_response(scope, workbook_list, fields=None):
+    """Build the /api/workbooks response, encoding and compressing each catalog load only once.
+
+    fields selects the columnar format with that projection; None sends
+    the full {"workbooks": [...]} records. The response carries a weak
+    ETag, and a matching If-None-Match gets an empty 304 instead.
+    """
+    entry = catalog_entry(scope, workbook_list)
+    etag = catalog_etag(entry['version'], fields)
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+
+    if (fields, None) not in entry:
+        payload = {'workbooks': workbook_list} if fields is None else columnar_catalog(workbook_list, fields)
+        entry[(fields, None)] = dumps_json(payload)
+    body = entry[(fields, None)]
+
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if len(body) < COMPRESS_MIN_SIZE:
+        encoding = None
+    if (fields, encoding) not in entry:
+        entry[(fields, encoding)] = compress(body, encoding)
+
+    resp = Response(entry[(fields, encoding)], mimetype='application/json')
+    resp.set_etag(etag, weak=True)
+    resp.vary.add('Accept-Encoding')
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    return resp
+
+def stream_workbooks(scope, server, siteId, headers, cached=None, fields=None):
+    """Yield the catalog as NDJSON, one {"workbooks": [...]} line per page.
+
+    cached, if given, is sent in pages; otherwise pages are sent as they
+    arrive from Tableau (unsorted). A final {"done": true, "total": n,
+    "etag": ...} or {"error": ...} line ends the stream. With fields, each
+    page line is instead a columnar {"count", "columns", "dictionaries"}
+    message whose dictionaries hold only the entries new since the
+    previous page.
+    """
+    if fields is None:
+        page_message = lambda records: {'workbooks': records}
+    else:
+        encoder = ColumnarEncoder(fields)
+        page_message = encoder.encode
+    
+    if cached is not None:
+        for i in range(0, len(cached), WORKBOOK_PAGE_SIZE):
+            yield ndjson(page_message(cached[i:i + WORKBOOK_PAGE_SIZE]))
+        yield ndjson({'done': True, 'total': len(cached), 'etag': catalog_etag(catalog_entry(scope, cached)['version'], fields)})
+        return
+    
+    # Only hold on to the records if they will be cached afterwards
+    keep = [] if CATALOG_CACHE_TTL > 0 else None
+    total = 0
+    version = 0
+    try:
+        for page in iter_workbook_pages(server, siteId, headers):
+            records = [workbook_info(wb) for wb in page]
+            total += len(records)
+            version = catalog_version(records, version)
+            if keep is not None:
+                keep.extend(records)
+            yield ndjson(page_message(records))
+    except TableauError as e:
+        yield ndjson({'error': str(e)})
+        return
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Workbooks request failed: {e}")
+        yield ndjson({'error': f"Connection failed: {str(e)}"})
+        return
+    except Exception as e:
+        app.logger.error(f"Error streaming workbooks: {e}")
+        yield ndjson({'error': f"Failed to fetch workbooks: {str(e)}"})
+        return
+    
+    if keep is not None:
+        keep.sort(key=lambda x: x['name'].lower())
+        _catalog_cache.put(scope, keep)
+        _encoded_catalogs.put(scope, {'source': keep, 'version': version})
+    yield ndjson({'done': True, 'total': total, 'etag': catalog_etag(version, fields)})
+
+@app.route('/api/workbooks', methods=['POST'])
+def workbooks():
+    data = request.json or {}
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    
+    # Optional compact format: parallel columns with only the requested fields
+    fields = None
+    if data.get('format', 'records') == 'columnar':
+        try:
+            fields = catalog_fields(data)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+    elif data.get('format', 'records') != 'records':
+        return jsonify(error="format must be 'records' or 'columnar'"), 400
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    try:
+        scope = catalog_scope(server, siteId, headers)
+        force = bool(data.get('noCache'))
+        
+        # Delta mode: only what changed since a previous sync
+        if data.get('since'):
+            try:
+                since = datetime.strptime(str(data['since']), '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%dT%H:%M:%SZ')
+            except ValueError:
+                return jsonify(error="since must be a UTC timestamp like 2024-01-31T17:30:00Z"), 400
+            
+            updated, total, ids = catalog_delta(scope, server, siteId, headers, since, bool(data.get('ids')), force)
+            body = {'since': since, 'total': total}
+            if fields is None:
+                body['workbooks'] = updated
+            else:
+                body.update(columnar_catalog(updated, fields))
+            if ids is not None:
+                body['ids'] = ids
+            return json_response(body)
+        
+        if data.get('stream'):
+            cached = None if force else _catalog_cache.peek(scope)
+            if cached is None:
+                cached = revalidate_catalog(scope, server, siteId, headers)
+                if cached is not None:
+                    _catalog_cache.put(scope, cached)
+            if cached is None:
+                return Response(stream_workbooks(scope, server, siteId, headers, fields=fields), mimetype='application/x-ndjson')
             
-            workbooks_data = body.get('workbooks', {})
-            workbooks = workbooks_data.get('workbook', [])
+            # A cached catalog's version is known before streaming, so it can be validated
+            etag = catalog_etag(catalog_entry(scope, cached)['version'], fields)
+            unchanged = not_modified(etag)
+            if unchanged is not None:
+                return unchanged
+            resp = Response(stream_workbooks(scope, server, siteId, headers, cached, fields), mimetype='application/x-ndjson')
+            resp.set_etag(etag, weak=True)
+            return resp
+        
+        workbook_list = load_catalog(scope, server, siteId, headers, force)
+        
+        return catalog_response(scope, workbook_list, fields)
+        
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Workbooks request failed: {e}")
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    except Exception as e:
+        app.logger.error(f"Error fetching workbooks: {e}")
+        return jsonify(error=f"Failed to fetch workbooks: {str(e)}"), 500
+
+class CatalogIndex:
+    """Lookup structures over one loaded catalog for filtering, sorting and facets.
+
+    Built once per catalog load. Search text is matched as a case-insensitive
+    substring of name, project or owner, like the page's own search box; a
+    trigram index narrows the candidates before the substring check.
+    """
+    SORTS = {
+        'name': lambda wb: wb['name'].lower(),
+        'project': lambda wb: (wb['project'].lower(), wb['name'].lower()),
+        'owner': lambda wb: (wb['owner'].lower(), wb['name'].lower()),
+        'updated': lambda wb: wb.get('updatedAt') or '',
+        'created': lambda wb: wb.get('createdAt') or ''
+    }
+    # Sorts shown newest-first in the UI
+    DESCENDING = {'updated', 'created'}
+    
+    def __init__(self, workbooks):
+        self.workbooks = workbooks
+        self.by_project = {}
+        self.by_owner = {}
+        self.by_tag = {}
+        self.trigrams = {}
+        self.haystacks = []
+        
+        for pos, wb in enumerate(workbooks):
+            self.by_project.setdefault(wb['project'], set()).add(pos)
+            self.by_owner.setdefault(wb['owner'], set()).add(pos)
+            for tag in wb.get('tags') or []:
+                self.by_tag.setdefault(tag, set()).add(pos)
             
-            if not workbooks:
+            haystack = '\n'.join((wb['name'], wb['project'], wb['owner'])).lower()
+            self.haystacks.append(haystack)
+            for gram in {haystack[i:i + 3] for i in range(len(haystack) - 2)}:
+                self.trigrams.setdefault(gram, []).append(pos)
+        
+        # Every position in each sort order, and each position's rank in it, so
+        # an unfiltered query is a slice and a filtered one sorts only its matches
+        self.orders = {}
+        self.ranks = {}
+        for key, sort_key in self.SORTS.items():
+            order = sorted(range(len(workbooks)), key=lambda pos: sort_key(workbooks[pos]), reverse=key in self.DESCENDING)
+            rank = [0] * len(workbooks)
+            for r, pos in enumerate(order):
+                rank[pos] = r
+            self.orders[key] = order
+            self.ranks[key] = rank
+        self.orders['name_desc'] = self.orders['name'][::-1]
+        self.all_facets = self.facets(range(len(workbooks)))
+    
+    def facets(self, positions):
+        """Project, owner and tag counts over the given positions"""
+        facets = {'project': {}, 'owner': {}, 'tag': {}}
+        for pos in positions:
+            wb = self.workbooks[pos]
+            facets['project'][wb['project']] = facets['project'].get(wb['project'], 0) + 1
+            facets['owner'][wb['owner']] = facets['owner'].get(wb['owner'], 0) + 1
+            for t in wb.get('tags') or []:
+                facets['tag'][t] = facets['tag'].get(t, 0) + 1
+        return facets
+    
+    def search(self, text):
+        """Return the positions whose name, project or owner contain text"""
+        text = text.lower()
+        if len(text) < 3:
+            return {pos for pos, haystack in enumerate(self.haystacks) if text in haystack}
+        
+        postings = sorted((self.trigrams.get(text[i:i + 3], []) for i in range(len(text) - 2)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
                 break
-                
-            all_workbooks.extend(workbooks)
+            candidates.intersection_update(posting)
+        return {pos for pos in candidates if text in self.haystacks[pos]}
+    
+    def query(self, q='', project='', owner='', tag='', sort='name', offset=0, limit=100):
+        matches = None
+        for positions in (self.by_project.get(project, set()) if project else None,
+                          self.by_owner.get(owner, set()) if owner else None,
+                          self.by_tag.get(tag, set()) if tag else None):
+            if positions is not None:
+                matches = set(positions) if matches is None else matches & positions
+        if q:
+            found = self.search(q)
+            matches = found if matches is None else matches & found
+        
+        if sort not in self.orders:
+            sort = 'name'
+        order = self.orders[sort]
+        if matches is None:
+            ordered, facets = order, self.all_facets
+        elif len(matches) > len(order) // 8:
+            # Broad matches: one pass over the precomputed order beats sorting them
+            ordered = [pos for pos in order if pos in matches]
+            facets = self.facets(ordered)
+        else:
+            rank = self.ranks['name' if sort == 'name_desc' else sort]
+            ordered = sorted(matches, key=rank.__getitem__, reverse=sort == 'name_desc')
+            facets = self.facets(ordered)
+        
+        return {
+            'total': len(ordered),
+            'offset': offset,
+            'limit': limit,
+            'workbooks': [self.workbooks[pos] for pos in ordered[offset:offset + limit]],
+            'facets': facets
+        }
+
+_catalog_indexes = TTLCache(CATALOG_CACHE_TTL, CATALOG_CACHE_SIZE)
+
+def catalog_index(scope, workbook_list):
+    """Return the index for a loaded catalog, building it on first use"""
+    index = _catalog_indexes.peek(scope)
+    if index is None or index.workbooks is not workbook_list:
+        index = _catalog_indexes.get(scope, lambda: CatalogIndex(workbook_list), force=True)
+    return index
+
+@app.route('/api/workbooks/query', methods=['POST'])
+def query_workbooks():
+    """Filter, sort and page the cached catalog on the server"""
+    data = request.json or {}
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    try:
+        offset = max(0, int(data.get('offset', 0)))
+        limit = max(0, min(int(data.get('limit', 100)), WORKBOOK_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify(error="offset and limit must be integers"), 400
+    
+    try:
+        scope = catalog_scope(server, siteId, headers)
+        workbook_list = load_catalog(scope, server, siteId, headers, bool(data.get('noCache')))
+        
+        result = catalog_index(scope, workbook_list).query(
+            q=data.get('q', ''),
+            project=data.get('project', ''),
+            owner=data.get('owner', ''),
+            tag=data.get('tag', ''),
+            sort=data.get('sort', 'name'),
+            offset=offset,
+            limit=limit
+        )
+        return json_response(result)
+        
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Workbook query request failed: {e}")
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    except Exception as e:
+        app.logger.error(f"Error querying workbooks: {e}")
+        return jsonify(error=f"Failed to query workbooks: {str(e)}"), 500
+
+# CSV export columns in default order, with their header labels
+EXPORT_COLUMNS = OrderedDict([
+    ('name', 'Name'),
+    ('project', 'Project'),
+    ('owner', 'Owner'),
+    ('createdAt', 'Created'),
+    ('updatedAt', 'Updated'),
+    ('id', 'ID'),
+    ('size', 'Size'),
+    ('contentUrl', 'Content URL'),
+    ('showTabs', 'Show Tabs'),
+    ('tags', 'Tags')
+])
+
+def workbook_matches(wb, q='', project='', owner='', tag='', ids=None):
+    """Apply the catalog query filters to one converted workbook record"""
+    if ids is not None and wb['id'] not in ids:
+        return False
+    if project and wb['project'] != project:
+        return False
+    if owner and wb['owner'] != owner:
+        return False
+    if tag and tag not in (wb.get('tags') or []):
+        return False
+    if q and q.lower() not in '\n'.join((wb['name'], wb['project'], wb['owner'])).lower():
+        return False
+    return True
+
+class _CsvLine:
+    """File-like target that hands back each row csv.writer formats"""
+    def write(self, line):
+        return line
+
+def stream_csv(records, columns):
+    """Yield CSV text for an iterable of workbook records, one row at a time"""
+    writer = csv.writer(_CsvLine())
+    yield writer.writerow([EXPORT_COLUMNS[c] for c in columns])
+    for wb in records:
+        row = []
+        for column in columns:
+            value = wb.get(column)
+            if column == 'tags':
+                value = ';'.join(value or [])
+            row.append('' if value is None else value)
+        yield writer.writerow(row)
+
+@app.route('/api/workbooks/export', methods=['GET', 'POST'])
+def export_workbooks():
+    """Stream the catalog, filtered and projected to the chosen columns, as CSV.
+
+    Accepts JSON, form fields or query parameters, so the page can trigger
+    a plain form download.
+    """
+    data = request.get_json(silent=True) or request.values
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    columns = [c.strip() for c in (data.get('columns') or ','.join(list(EXPORT_COLUMNS)[:6])).split(',') if c.strip()]
+    unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+    if unknown:
+        return jsonify(error=f"Unknown columns: {', '.join(unknown)}"), 400
+    
+    ids = data.get('ids')
+    filters = {
+        'q': data.get('q', ''),
+        'project': data.get('project', ''),
+        'owner': data.get('owner', ''),
+        'tag': data.get('tag', ''),
+        'ids': set(ids.split(',') if isinstance(ids, str) else ids) if ids else None
+    }
+    
+    try:
+        scope = catalog_scope(server, siteId, headers)
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    
+    cached = _catalog_cache.peek(scope)
+    if cached is not None:
+        records = cached
+    else:
+        # Convert page by page so memory stays flat however large the site is
+        records = (workbook_info(wb) for page in iter_workbook_pages(server, siteId, headers) for wb in page)
+    
+    def generate():
+        try:
+            yield from stream_csv((wb for wb in records if workbook_matches(wb, **filters)), columns)
+        except Exception as e:
+            # Headers are already sent; leave a marker row rather than a silently short file
+            app.logger.error(f"Error exporting workbooks: {e}")
+            yield f"# export failed: {str(e)}\n"
+    
+    filename = f"tableau_workbooks_{datetime.utcnow().strftime('%Y-%m-%d')}.csv"
+    resp = Response(generate(), mimetype='text/csv')
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return resp
+
+def refresh_result(item_id, resp):
+    """Build a result entry from the refresh POST response"""
+    if resp.status_code in [200, 201, 202]:
+        # Parse response to get job information
+        try:
+            job_info = resp.json()
+            job_id = job_info.get('job', {}).get('id')
+            return {
+                'id': item_id, 
+                'success': True, 
+                'jobId': job_id,
+                'message': 'Refresh job started successfully'
+            }
+        except:
+            return {
+                'id': item_id, 
+                'success': True,
+                'message': 'Refresh initiated successfully'
+            }
+    
+    error_msg = f"HTTP {resp.status_code}"
+    try:
+        error_response = resp.json()
+        if 'error' in error_response:
+            error_msg = error_response['error'].get('summary', error_msg)
+    except:
+        error_msg = resp.text[:200] if resp.text else error_msg
+        
+    return {
+        'id': item_id, 
+        'success': False, 
+        'error': error_msg
+    }
+
+_job_targets = TTLCache(3600, 50000)
+
+def find_refresh_job(server, siteId, headers, kind, item_id, since):
+    """Look for an extract refresh job for a workbook or datasource created since the given time.
+
+    Returns (job_id, checked). checked is False when the site's jobs could
+    not be fully inspected (a failed call, or more than JOB_LOOKUP_PAGES
+    pages of them), in which case a retry might start a duplicate.
+    """
+    url = f"{server}/api/3.17/sites/{siteId}/jobs"
+    
+    def job_target(job_id):
+        def load():
+            detail = tableau_request(server, 'GET', f"{url}/{job_id}", headers=headers, timeout=30)
+            if detail.status_code != 200:
+                raise TableauError(f"Job lookup failed ({detail.status_code})", detail.status_code)
+            extract = detail.json().get('job', {}).get('extractRefreshJob', {})
+            return (extract.get('workbook') or extract.get('datasource') or {}).get('id')
+        return _job_targets.get((server, siteId, job_id), load)
+    
+    pool = ThreadPoolExecutor(max_workers=JOB_LOOKUP_CONCURRENCY)
+    try:
+        seen = 0
+        for page_number in range(1, JOB_LOOKUP_PAGES + 1):
+            params = {
+                'pageSize': 1000,
+                'pageNumber': page_number,
+                'filter': f'jobType:eq:refresh_extracts,createdAt:gte:{since}'
+            }
+            resp = tableau_request(server, 'GET', url, headers=headers, params=params, timeout=30)
+            if resp.status_code != 200:
+                return None, False
+            body = resp.json()
+            job_ids = [job.get('id') for job in body.get('backgroundJobs', {}).get('backgroundJob', [])]
+            
+            # The listing doesn't say which item a job is for, so check each one
+            for job_id, target in zip(job_ids, pool.map(job_target, job_ids)):
+                if target == item_id:
+                    return job_id, True
             
-            # Check if we have more pages
-            pagination = body.get('pagination', {})
-            total_available = int(pagination.get('totalAvailable', 0))
+            seen += len(job_ids)
+            if not job_ids or seen >= int(body.get('pagination', {}).get('totalAvailable', 0)):
+                return None, True
+        return None, False
+    except (requests.exceptions.RequestException, ValueError, TableauError):
+        return None, False
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def incremental_unsupported(resp):
+    """Return Tableau's reason if it rejected an incremental refresh the extract can't do, else None"""
+    if resp.status_code not in (400, 409):
+        return None
+    try:
+        error = resp.json().get('error', {})
+    except ValueError:
+        return None
+    reason = error.get('detail') or error.get('summary') or ''
+    return reason if 'incremental' in reason.lower() else None
+
+def incremental_targets(server, siteId, headers):
+    """Return the ids of workbooks and datasources with an incremental refresh task.
+
+    Returns None if the site's extract refresh tasks can't be read.
+    """
+    url = f"{server}/api/3.17/sites/{siteId}/tasks/extractRefreshes"
+    try:
+        resp = tableau_call(server, 'GET', url, headers=headers, timeout=30)
+        if resp.status_code != 200:
+            app.logger.warning(f"Extract refresh task lookup failed ({resp.status_code})")
+            return None
+        ids = set()
+        for task in resp.json().get('tasks', {}).get('task', []):
+            extract = task.get('extractRefresh', {})
+            if extract.get('type') == 'IncrementalRefresh':
+                target = extract.get('workbook') or extract.get('datasource') or {}
+                ids.add(target.get('id'))
+        return ids
+    except (requests.exceptions.RequestException, ValueError) as e:
+        app.logger.warning(f"Extract refresh task lookup failed: {e}")
+        return None
+
+def refresh_item(server, siteId, headers, kind, item_id, timeout=REFRESH_TIMEOUT, refresh_type='full', fallback=False):
+    """Start an extract refresh for one workbook or datasource and return its result entry.
+
+    kind is 'workbook' or 'datasource', refresh_type 'full' or 'incremental'.
+    With fallback, an incremental refresh Tableau rejects as unsupported is
+    resubmitted as a full refresh. Throttled or failed submissions are
+    retried within the retry budget; the number of retries is reported as
+    "retries" and the type that ran as "refreshType".
+    """
+    # Use the extract refresh endpoint
+    url = f"{server}/api/3.17/sites/{siteId}/{kind}s/{item_id}/refresh"
+    
+    # Prepare the refresh request body
+    refresh_body = {
+        "task": {
+            "extractRefresh": {
+                "type": REFRESH_TYPES[refresh_type]
+            }
+        }
+    }
+    fallback_reason = None
+    
+    deadline = time.monotonic() + RETRY_BUDGET
+    attempt = 0
+    while True:
+        submitted_at = (datetime.utcnow() - timedelta(seconds=JOB_CLOCK_SKEW)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        retry_after = None
+        try:
+            resp = tableau_request(
+                server, 'POST', url, 
+                headers=headers, 
+                json=refresh_body,
+                timeout=timeout
+            )
+            result = refresh_result(item_id, resp)
+            retryable = resp.status_code in RETRYABLE_STATUSES
+            ambiguous = resp.status_code in AMBIGUOUS_STATUSES
+            retry_after = retry_after_seconds(resp)
             
-            if len(all_workbooks) >= total_available:
+            unsupported = incremental_unsupported(resp) if fallback and refresh_type == 'incremental' else None
+            if unsupported:
+                # Not a transient failure, so go straight to a full refresh
+                fallback_reason = unsupported
+                refresh_type = 'full'
+                refresh_body['task']['extractRefresh']['type'] = REFRESH_TYPES['full']
+                continue
+        except requests.exceptions.Timeout:
+            result = {
+                'id': item_id, 
+                'success': False, 
+                'error': 'Request timeout - refresh may still be processing'
+            }
+            retryable = ambiguous = True
+        except requests.exceptions.RequestException as e:
+            result = {
+                'id': item_id, 
+                'success': False, 
+                'error': f'Connection error: {str(e)}'
+            }
+            retryable = ambiguous = isinstance(e, requests.exceptions.ConnectionError)
+        except Exception as e:
+            app.logger.error(f"Error refreshing {kind} {item_id}: {e}")
+            result = {
+                'id': item_id, 
+                'success': False, 
+                'error': f'Unexpected error: {str(e)}'
+            }
+            retryable = ambiguous = False
+        
+        if result['success'] or not retryable:
+            break
+        delay = retry_delay(attempt, deadline, retry_after)
+        if delay is None:
+            break
+        time.sleep(delay)
+        
+        if ambiguous:
+            # The POST may have reached Tableau; only resubmit if no job exists
+            job_id, checked = find_refresh_job(server, siteId, headers, kind, item_id, submitted_at)
+            if job_id:
+                result = {
+                    'id': item_id, 
+                    'success': True, 
+                    'jobId': job_id,
+                    'message': 'Refresh job found after an interrupted request'
+                }
+                break
+            if not checked:
                 break
+        attempt += 1
+    
+    result['retries'] = attempt
+    result['refreshType'] = refresh_type
+    if fallback_reason:
+        result['fallbackReason'] = fallback_reason
+    return result
+
+def stream_refresh(batch, watch=False):
+    """Yield each of a RefreshBatch's results as NDJSON in completion order.
+
+    A final {"done": true, ...} line carries the batch summary. The batch
+    runs in its own thread and the stream only relays it, so submissions are
+    still finished and recorded if the client disconnects.
+    """
+    relay = SimpleQueue()
+    
+    def drive():
+        results = []
+        try:
+            for _, result in batch.results():
+                results.append(result)
+                relay.put(result)
+        finally:
+            try:
+                batch.finish(results, watch)
+            except Exception as e:
+                app.logger.error(f"Failed to record refresh batch {batch.id}: {e}")
+            relay.put(None)
+    
+    threading.Thread(target=drive, name=f"batch-{batch.id}", daemon=True).start()
+    results = []
+    for result in iter(relay.get, None):
+        results.append(result)
+        yield ndjson(result)
+    yield ndjson(batch.summary(results))
+
+_batches = TTLCache(BATCH_TTL, BATCH_HISTORY_SIZE)
+
+def register_batch(batch_id, server, siteId, results, submitted_at):
+    """Remember which jobs a refresh batch started so they can be polled together"""
+    _batches.put(batch_id, {
+        'server': server,
+        'siteId': siteId,
+        'submittedAt': submitted_at,
+        'jobs': {r['jobId']: r['id'] for r in results if r.get('jobId')}
+    })
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list, or None if it's empty"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+class HistoryStore:
+    """Embedded SQLite log of refresh submissions and their job outcomes.
+
+    Callers only append to an in-memory queue; a background thread commits
+    the queue in one transaction per flush, so a large batch costs a handful
+    of commits rather than one per workbook.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS refreshes (
+            batch_id TEXT,
+            server TEXT NOT NULL,
+            site_id TEXT NOT NULL,
+            job_id TEXT,
+            item_type TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            item_name TEXT,
+            project TEXT,
+            refresh_type TEXT,
+            submitted_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            started_at TEXT,
+            ended_at TEXT,
+            queued_seconds INTEGER,
+            run_seconds INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS refreshes_job ON refreshes (server, site_id, job_id);
+        CREATE INDEX IF NOT EXISTS refreshes_submitted ON refreshes (server, site_id, submitted_at);
+        CREATE INDEX IF NOT EXISTS refreshes_item ON refreshes (server, site_id, item_id, submitted_at);
+    """
+    INSERT = """
+        INSERT INTO refreshes (batch_id, server, site_id, job_id, item_type, item_id, item_name,
+                               project, refresh_type, submitted_at, status, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    UPDATE = """
+        UPDATE refreshes SET status = ?, started_at = ?, ended_at = ?, queued_seconds = ?, run_seconds = ?
+        WHERE server = ? AND site_id = ? AND job_id = ?
+    """
+    
+    def __init__(self, path, flush_interval, batch_size):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = []
+        self._cond = threading.Condition()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+    
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    def _enqueue(self, statements):
+        with self._cond:
+            self._pending.extend(statements)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+            self.flush()
+    
+    def flush(self):
+        """Commit everything queued so far in one transaction"""
+        with self._db_lock:
+            with self._cond:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                conn = self._connect()
+                with conn:
+                    for sql, group in groupby(pending, key=lambda statement: statement[0]):
+                        conn.executemany(sql, [params for _, params in group])
+            except sqlite3.Error as e:
+                app.logger.error(f"Refresh history write failed, dropped {len(pending)} records: {e}")
+    
+    def record_submissions(self, batch_id, server, siteId, results, submitted_at, catalog):
+        """Queue one row per refresh result; catalog maps workbook ids to their records"""
+        rows = []
+        for result in results:
+            kind = result.get('type', 'workbook')
+            workbook = catalog.get(result['id'], {}) if kind == 'workbook' else {}
+            rows.append((self.INSERT, (
+                batch_id, server, siteId, result.get('jobId'), kind, result['id'],
+                result.get('name') or workbook.get('name'), workbook.get('project'),
+                result.get('refreshType'), submitted_at,
+                'Pending' if result.get('success') else 'SubmitFailed', result.get('error')
+            )))
+        self._enqueue(rows)
+    
+    def record_outcome(self, server, siteId, job_id, summary):
+        """Queue a job's final status and timings"""
+        if summary.get('status') not in OUTCOME_STATUSES:
+            return
+        self._enqueue([(self.UPDATE, (
+            summary['status'], summary.get('startedAt'), summary.get('endedAt'),
+            seconds_between(summary.get('createdAt'), summary.get('startedAt')),
+            seconds_between(summary.get('startedAt'), summary.get('endedAt')),
+            server, siteId, job_id
+        ))])
+    
+    def _query(self, sql, params):
+        self.flush()
+        with self._db_lock:
+            return self._connect().execute(sql, params).fetchall()
+    
+    def recent_run_seconds(self, server, siteId, item_ids, runs=5):
+        """Median of each item's last few successful run times"""
+        durations = {}
+        for item_id in item_ids:
+            rows = self._query("""
+                SELECT run_seconds FROM refreshes
+                WHERE server = ? AND site_id = ? AND item_id = ? AND status = 'Success' AND run_seconds IS NOT NULL
+                ORDER BY submitted_at DESC LIMIT ?
+            """, (server, siteId, item_id, runs))
+            if rows:
+                durations[item_id] = percentile(sorted(row[0] for row in rows), 50)
+        return durations
+    
+    def stats(self, server, siteId, group_by, days):
+        """Per-workbook or per-project duration percentiles, failure rates and trend.
+
+        Figures cover the last `days` days; the trend compares their median run
+        time with the median over the `days` before that.
+        """
+        now = datetime.utcnow()
+        since = (now - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        previous_since = (now - timedelta(days=2 * days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        rows = self._query("""
+            SELECT item_type, item_id, item_name, project, status, run_seconds, submitted_at FROM refreshes
+            WHERE server = ? AND site_id = ? AND submitted_at >= ? AND status != 'Pending'
+        """, (server, siteId, previous_since))
+        
+        groups = {}
+        for item_type, item_id, item_name, project, status, run_seconds, submitted_at in rows:
+            if group_by == 'project':
+                key = project or '(unknown)'
+                group = groups.setdefault(key, {'project': key})
+            else:
+                key = (item_type, item_id)
+                group = groups.setdefault(key, {'type': item_type, 'id': item_id, 'name': item_name, 'project': project})
+            window = 'recent' if submitted_at >= since else 'previous'
+            group.setdefault(window, []).append((status, run_seconds))
+        
+        report = []
+        for group in groups.values():
+            recent = group.pop('recent', [])
+            previous = group.pop('previous', [])
+            if not recent:
+                continue
+            durations = sorted(seconds for status, seconds in recent if status == 'Success' and seconds is not None)
+            previous_durations = sorted(seconds for status, seconds in previous if status == 'Success' and seconds is not None)
+            failed = sum(1 for status, _ in recent if status != 'Success')
+            p50 = percentile(durations, 50)
+            previous_p50 = percentile(previous_durations, 50)
+            group.update({
+                'runs': len(recent),
+                'failed': failed,
+                'failureRate': round(failed / len(recent), 3),
+                'p50Seconds': p50,
+                'p95Seconds': percentile(durations, 95),
+                'previousP50Seconds': previous_p50,
+                'trendPercent': round((p50 / previous_p50 - 1) * 100, 1) if p50 is not None and previous_p50 else None
+            })
+            report.append(group)
+        
+        report.sort(key=lambda group: group['p95Seconds'] or 0, reverse=True)
+        return {'groupBy': group_by, 'days': days, 'since': since, 'groups': report}
+
+_history = HistoryStore(HISTORY_DB, HISTORY_FLUSH_INTERVAL, HISTORY_BATCH_SIZE) if HISTORY_DB else None
+if _history:
+    atexit.register(_history.flush)
+
+class DurationHistory:
+    """Smoothed extract refresh run times for the most recently refreshed items"""
+    def __init__(self, max_entries, smoothing):
+        self.max_entries = max_entries
+        self.smoothing = smoothing
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def record(self, server, siteId, item_id, seconds, job_id=None):
+        """Fold one finished run into the item's average; repeat reports of a job are ignored"""
+        key = (server, siteId, item_id)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                entry = {'seconds': float(seconds), 'runs': 1, 'jobId': job_id}
+            elif job_id is None or job_id != entry['jobId']:
+                entry = {
+                    'seconds': entry['seconds'] + self.smoothing * (seconds - entry['seconds']),
+                    'runs': entry['runs'] + 1,
+                    'jobId': job_id
+                }
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get(self, server, siteId, item_id):
+        with self._lock:
+            entry = self._entries.get((server, siteId, item_id))
+            return entry['seconds'] if entry else None
+
+_durations = DurationHistory(DURATION_HISTORY_SIZE, DURATION_SMOOTHING)
+
+def cached_workbooks(server, siteId, headers, ids=None):
+    """Return the caller's catalog by workbook id, or {} if it can't be read.
+
+    An expired catalog still serves names, projects and sizes. With ids, the
+    catalog is loaded (or revalidated) when any of them is missing from it.
+    """
+    try:
+        scope = catalog_scope(server, siteId, headers)
+        workbooks = _catalog_cache.peek(scope, stale=True) or []
+        if ids is not None and not set(ids) <= {wb['id'] for wb in workbooks}:
+            workbooks = load_catalog(scope, server, siteId, headers)
+    except (TableauError, requests.exceptions.RequestException) as e:
+        app.logger.warning(f"Cached catalog unavailable: {e}")
+        return {}
+    return {wb['id']: wb for wb in workbooks}
+
+def refresh_sizes(server, siteId, headers, data):
+    """Return extract sizes in MB by item id, from the request or the cached catalog"""
+    sizes = {item_id: wb.get('size') for item_id, wb in cached_workbooks(server, siteId, headers).items()}
+    sizes.update(data.get('sizes') or {})
+    
+    parsed = {}
+    for item_id, size in sizes.items():
+        try:
+            parsed[item_id] = float(size)
+        except (TypeError, ValueError):
+            continue
+    return parsed
+
+def estimate_durations(server, siteId, targets, sizes):
+    """Estimate each target's run time in seconds; returns {target: (seconds, basis)}"""
+    history = {target: _durations.get(server, siteId, target[1]) for target in targets}
+    
+    # Fall back to the persistent history for items not refreshed since startup
+    unknown = [item_id for (_, item_id), seconds in history.items() if seconds is None]
+    if _history and unknown:
+        try:
+            stored = _history.recent_run_seconds(server, siteId, unknown)
+            history = {target: stored.get(target[1]) if seconds is None else seconds for target, seconds in history.items()}
+        except sqlite3.Error as e:
+            app.logger.warning(f"Refresh history unavailable for scheduling: {e}")
+    
+    # Calibrate seconds per MB on items in this batch with both a history and a size
+    measured = [(history[t], sizes[t[1]]) for t in targets if history[t] is not None and sizes.get(t[1])]
+    total_mb = sum(size for _, size in measured)
+    rate = sum(seconds for seconds, _ in measured) / total_mb if total_mb else SCHEDULE_SECONDS_PER_MB
+    
+    estimates = {}
+    for target in targets:
+        if history[target] is not None:
+            estimates[target] = (history[target], 'history')
+        elif sizes.get(target[1]):
+            estimates[target] = (sizes[target[1]] * rate, 'size')
+        else:
+            estimates[target] = (SCHEDULE_DEFAULT_SECONDS, 'default')
+    return estimates
+
+def build_schedule(targets, estimates, policy, slots):
+    """Order targets for submission and simulate them on slots backgrounders.
+
+    Each job starts on whichever backgrounder frees up first, as queued
+    extract jobs do, so the latest finish is the predicted batch makespan.
+    """
+    if policy == 'lpt':
+        ordered = sorted(targets, key=lambda t: -estimates[t][0])
+    elif policy == 'spt':
+        ordered = sorted(targets, key=lambda t: estimates[t][0])
+    else:
+        ordered = list(targets)
+    
+    free_at = [0.0] * slots
+    entries = []
+    for kind, item_id in ordered:
+        seconds, basis = estimates[(kind, item_id)]
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + seconds)
+        entries.append({
+            'type': kind,
+            'id': item_id,
+            'estimatedSeconds': round(seconds),
+            'basis': basis,
+            'predictedStart': round(start),
+            'predictedFinish': round(start + seconds)
+        })
+    
+    makespan = max(free_at) if entries else 0.0
+    return ordered, {
+        'policy': policy,
+        'slots': slots,
+        'makespanSeconds': round(makespan),
+        'predictedFinishAt': (datetime.utcnow() + timedelta(seconds=makespan)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'order': entries
+    }
+
+def refresh_targets(data):
+    """Return the (kind, id) refresh targets and planned datasources for a refresh request"""
+    # A plan from /api/refresh/plan refreshes shared datasources once instead
+    plan = data.get('plan')
+    if plan:
+        datasources = {ds['id']: ds for ds in plan.get('datasources', [])}
+        targets = [('datasource', ds_id) for ds_id in datasources]
+        targets += [('workbook', wb_id) for wb_id in plan.get('workbookIds', [])]
+    else:
+        datasources = {}
+        targets = [('workbook', wb_id) for wb_id in data.get('workbookIds', [])]
+    # A repeated id is refreshed once, whichever way the batch runs
+    return list(dict.fromkeys(targets)), datasources
+
+def schedule_refresh(server, siteId, headers, data, targets):
+    """Order a request's targets by its schedule policy; returns (ordered targets, schedule)"""
+    policy = data.get('schedule', SCHEDULE_POLICY)
+    if policy not in SCHEDULE_POLICIES:
+        raise ValueError(f"schedule must be one of {', '.join(sorted(SCHEDULE_POLICIES))}")
+    try:
+        slots = max(1, int(data.get('slots', BACKGROUNDER_SLOTS)))
+    except (TypeError, ValueError):
+        raise ValueError("slots must be numeric")
+    
+    sizes = refresh_sizes(server, siteId, headers, data)
+    estimates = estimate_durations(server, siteId, targets, sizes)
+    return build_schedule(targets, estimates, policy, slots)
+
+class AdmissionGate:
+    """Holds refresh submissions while the site's backgrounder queue is deep.
+
+    The queue depth is the number of Pending or InProgress extract refresh
+    jobs, read from the jobs listing's totalAvailable. Submissions admitted
+    since the last check count towards the depth until the next check, so a
+    burst of workers can't overshoot the target between polls.
+    """
+    def __init__(self, server, siteId, headers, target_depth=ADMISSION_TARGET_DEPTH, poll_interval=ADMISSION_POLL_INTERVAL):
+        self.server = server
+        self.siteId = siteId
+        self.headers = headers
+        self.target_depth = target_depth
+        self.poll_interval = poll_interval
+        self.depth = None
+        self.polled_at = 0.0
+        self.admitted = 0
+        self._lock = threading.Lock()
+    
+    def queue_depth(self):
+        """Return the number of queued or running extract jobs, or None if unknown"""
+        url = f"{self.server}/api/3.17/sites/{self.siteId}/jobs"
+        params = {
+            'pageSize': 1,
+            'filter': 'jobType:eq:refresh_extracts,status:in:[Pending,InProgress]'
+        }
+        try:
+            resp = tableau_call(self.server, 'GET', url, headers=self.headers, params=params, timeout=30)
+            if resp.status_code == 200:
+                return int(resp.json().get('pagination', {}).get('totalAvailable', 0))
+            app.logger.warning(f"Queue depth check failed ({resp.status_code})")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            app.logger.warning(f"Queue depth check failed: {e}")
+        return None
+    
+    def admit(self):
+        """Block until a submission may go ahead; return the seconds spent waiting"""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.depth is None or now - self.polled_at >= self.poll_interval:
+                    self.depth = self.queue_depth()
+                    self.polled_at = now
+                    self.admitted = 0
                 
-            page_number += 1
+                # If the queue can't be read, don't hold the batch hostage
+                if self.depth is None or self.depth + self.admitted < self.target_depth:
+                    self.admitted += 1
+                    return round(now - started, 1)
+                wait = self.poll_interval - (now - self.polled_at)
+            time.sleep(max(wait, 0.1))
+
+def fetch_workbook_connections(server, siteId, headers, wb_id):
+    """Return the connection records of one workbook"""
+    url = f"{server}/api/3.17/sites/{siteId}/workbooks/{wb_id}/connections"
+    resp = tableau_request(server, 'GET', url, headers=headers, timeout=30)
+    if resp.status_code != 200:
+        raise TableauError(f"Fetch connections failed ({resp.status_code})", resp.status_code)
+    return resp.json().get('connections', {}).get('connection', [])
+
+def datasource_has_extracts(server, siteId, headers, ds_id):
+    """Return whether a published datasource holds an extract, or None if it can't be read"""
+    url = f"{server}/api/3.17/sites/{siteId}/datasources/{ds_id}"
+    try:
+        resp = tableau_request(server, 'GET', url, headers=headers, timeout=30)
+        if resp.status_code != 200:
+            return None
+        return str(resp.json().get('datasource', {}).get('hasExtracts')).lower() == 'true'
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+def workbooks_with_extracts(server, siteId, headers):
+    """Return the ids of the site's workbooks that contain extracts, or None if they can't be listed"""
+    try:
+        pages = iter_workbook_pages(server, siteId, headers, query_filter='hasExtracts:eq:true', fields='id')
+        return {wb.get('id') for page in pages for wb in page}
+    except (TableauError, requests.exceptions.RequestException, ValueError):
+        return None
+
+def plan_refresh(server, siteId, headers, workbook_ids):
+    """Work out the fewest refresh jobs that cover the selected workbooks' extracts.
+
+    Connections of type "sqlproxy" point at published datasources, which are
+    refreshed once however many selected workbooks use them, if they hold an
+    extract. Any other connection is embedded in the workbook, which gets
+    its own refresh if it contains extracts. Workbooks whose connections
+    can't be read keep a workbook refresh, as before; where extracts can't
+    be checked, the refresh is kept too. Workbooks left with nothing to
+    refresh are listed under "skipped".
+    """
+    def resolve(wb_id):
+        try:
+            return wb_id, fetch_workbook_connections(server, siteId, headers, wb_id), None
+        except (TableauError, requests.exceptions.RequestException, ValueError) as e:
+            return wb_id, None, str(e)
+    
+    datasources = OrderedDict()
+    workbook_refreshes = []
+    unresolved = []
+    skipped = []
+    resolved = OrderedDict()
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(REFRESH_CONCURRENCY, len(workbook_ids)))) as pool:
+        for wb_id, connections, error in pool.map(resolve, workbook_ids):
+            if connections is None:
+                unresolved.append({'id': wb_id, 'error': error})
+                workbook_refreshes.append(wb_id)
+            else:
+                resolved[wb_id] = connections
         
-        # Process workbooks with enhanced information
-        workbook_list = []
-        for wb in all_workbooks:
-            workbook_info = {
-                'id': wb.get('id'),
-                'name': wb.get('name', 'Unknown'),
-                'project': wb.get('project', {}).get('name', 'Default'),
-                'owner': wb.get('owner', {}).get('name', 'Unknown'),
-                'createdAt': wb.get('createdAt'),
-                'updatedAt': wb.get('updatedAt'),
-                'size': wb.get('size'),
-                'contentUrl': wb.get('contentUrl'),
-                'showTabs': wb.get('showTabs', False),
-                'tags': [tag.get('label', '') for tag in wb.get('tags', {}).get('tag', [])]
-            }
-            workbook_list.append(workbook_info)
+        # Only extracts can be refreshed, so find out which sources hold one
+        published = {conn['datasource']['id']: conn['datasource'] for connections in resolved.values() for conn in connections
+                     if conn.get('type') == 'sqlproxy' and conn.get('datasource', {}).get('id')}
+        has_extracts = dict(zip(published, pool.map(lambda ds_id: datasource_has_extracts(server, siteId, headers, ds_id), published)))
+    
+    embedded = {wb_id for wb_id, connections in resolved.items()
+                if any(not (conn.get('type') == 'sqlproxy' and conn.get('datasource', {}).get('id')) for conn in connections)}
+    extract_workbooks = workbooks_with_extracts(server, siteId, headers) if embedded else set()
+    
+    for wb_id, connections in resolved.items():
+        covered = False
+        for conn in connections:
+            ds_id = conn.get('datasource', {}).get('id')
+            if conn.get('type') != 'sqlproxy' or not ds_id or has_extracts[ds_id] is False:
+                continue
+            ds = published[ds_id]
+            entry = datasources.setdefault(ds_id, {'id': ds_id, 'name': ds.get('name'), 'workbookIds': []})
+            if wb_id not in entry['workbookIds']:
+                entry['workbookIds'].append(wb_id)
+            covered = True
+        
+        if wb_id in embedded and (extract_workbooks is None or wb_id in extract_workbooks):
+            workbook_refreshes.append(wb_id)
+            covered = True
+        
+        if not covered:
+            reason = 'Workbook has no connections' if not connections else 'No extracts to refresh; every connection is live'
+            skipped.append({'id': wb_id, 'reason': reason})
+    
+    jobs_planned = len(datasources) + len(workbook_refreshes)
+    return {
+        'datasources': list(datasources.values()),
+        'workbookIds': workbook_refreshes,
+        'unresolved': unresolved,
+        'skipped': skipped,
+        'jobsWithoutPlan': len(workbook_ids),
+        'jobsPlanned': jobs_planned,
+        # Jobs saved by sharing datasources; skipped workbooks aren't counted
+        'jobsSaved': len(workbook_ids) - len(skipped) - jobs_planned
+    }
+
+class RefreshBatch:
+    """A set of refresh targets with a request's refresh options applied.
+
+    options takes the same fields as /api/refresh (concurrency, timeout,
+    refreshType, refreshTypes, admission, schedule, slots, sizes), so the web
+    endpoint and the command line submit the same way. Invalid options raise
+    ValueError.
+    """
+    def __init__(self, server, siteId, headers, options, targets, datasources=None, batch_id=None, submitted_at=None):
+        self.server = server
+        self.siteId = siteId
+        self.headers = headers
+        self.targets = targets
+        self.datasources = datasources or {}
+        self.id = batch_id or uuid.uuid4().hex
+        self.submitted_at = submitted_at or datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        
+        try:
+            concurrency = int(options.get('concurrency', REFRESH_CONCURRENCY))
+            self.timeout = float(options.get('timeout', REFRESH_TIMEOUT))
+        except (TypeError, ValueError):
+            raise ValueError("concurrency and timeout must be numeric")
+        
+        self.ordered, self.schedule = schedule_refresh(server, siteId, headers, options, targets)
+        self.concurrency = max(1, min(concurrency, REFRESH_CONCURRENCY, len(targets) or 1))
+        
+        # Refresh type per item: refreshTypes overrides refreshType overrides the default
+        self.refresh_type = options.get('refreshType', REFRESH_TYPE)
+        self.refresh_types = options.get('refreshTypes') or {}
+        if not isinstance(self.refresh_types, dict) or not {self.refresh_type, *self.refresh_types.values()} <= REFRESH_POLICIES:
+            raise ValueError(f"refreshType must be one of {', '.join(sorted(REFRESH_POLICIES))}")
+        self.incremental_ids = None
+        if 'auto' in (self.refresh_type, *self.refresh_types.values()):
+            self.incremental_ids = incremental_targets(server, siteId, headers)
+        
+        admission = options.get('admission')
+        self.gate = None
+        if admission:
+            settings = admission if isinstance(admission, dict) else {}
+            try:
+                self.gate = AdmissionGate(
+                    server, siteId, headers,
+                    target_depth=int(settings.get('targetDepth', ADMISSION_TARGET_DEPTH)),
+                    poll_interval=float(settings.get('pollInterval', ADMISSION_POLL_INTERVAL))
+                )
+            except (TypeError, ValueError):
+                raise ValueError("admission targetDepth and pollInterval must be numeric")
+    
+    @property
+    def prediction(self):
+        return {key: self.schedule[key] for key in ('policy', 'slots', 'makespanSeconds', 'predictedFinishAt')}
+    
+    def refresh_policy(self, item_id):
+        """Return (refresh type, fall back to full) for an item"""
+        policy = self.refresh_types.get(item_id, self.refresh_type)
+        if policy != 'auto':
+            return policy, False
+        if self.incremental_ids is not None and item_id not in self.incremental_ids:
+            return 'full', False
+        # Incremental task found, or the tasks couldn't be read: try incremental first
+        return 'incremental', True
+    
+    def describe(self, target, result):
+        """Fill in the fields every result entry carries, for results not produced by refresh_item()"""
+        kind, item_id = target
+        result.setdefault('retries', 0)
+        result.setdefault('refreshType', self.refresh_policy(item_id)[0])
+        if kind == 'datasource':
+            result['type'] = 'datasource'
+            result['name'] = self.datasources.get(item_id, {}).get('name')
+            result['workbookIds'] = self.datasources.get(item_id, {}).get('workbookIds', [])
+        return result
+    
+    def run(self, target):
+        """Submit one target's refresh and return its result entry"""
+        kind, item_id = target
+        waited = self.gate.admit() if self.gate else None
+        item_type, fallback = self.refresh_policy(item_id)
+        result = refresh_item(self.server, self.siteId, self.headers, kind, item_id, self.timeout, item_type, fallback)
+        if self.gate:
+            result['admissionWait'] = waited
+        return self.describe(target, result)
+    
+    def results(self, run=None):
+        """Submit every target in schedule order and yield (target, result) as each completes.
+
+        Every way of running a batch (streamed, synchronous, queued, command
+        line) goes through here. run replaces self.run for each target; the
+        queue wraps it to checkpoint. Submissions already started keep going
+        if the consumer stops early.
+        """
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = {pool.submit(run or self.run, target): target for target in self.ordered}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            pool.shutdown(wait=False)
+    
+    def finish(self, results, watch=False):
+        """Remember the batch's jobs for status polling and in the refresh history.
+
+        With watch, a background watcher follows the jobs to completion.
+        """
+        register_batch(self.id, self.server, self.siteId, results, self.submitted_at)
+        if _history:
+            # Names and projects come from the catalog, fetched if this process hasn't loaded it
+            workbook_ids = [r['id'] for r in results if r.get('type', 'workbook') == 'workbook']
+            _history.record_submissions(self.id, self.server, self.siteId, results, self.submitted_at,
+                                        cached_workbooks(self.server, self.siteId, self.headers, workbook_ids))
+        if watch:
+            start_watcher(self.id, self.server, self.siteId, self.headers)
+    
+    def summary(self, results):
+        """The {"done": true, ...} totals line that ends a batch's results"""
+        succeeded = sum(1 for r in results if r['success'])
+        return {'done': True, 'succeeded': succeeded, 'failed': len(results) - succeeded,
+                'batchId': self.id, 'schedule': self.prediction}
+
+class BatchQueue:
+    """SQLite-backed queue of refresh batches and their per-item checkpoints.
+
+    Each item moves pending -> submitting -> done; "submitting" is written
+    before the refresh POST so a resumed batch knows which submissions may
+    already have reached Tableau. The batch's auth token is kept only until
+    the batch finishes.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS batches (
+            id TEXT PRIMARY KEY,
+            server TEXT NOT NULL,
+            site_id TEXT NOT NULL,
+            token TEXT,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            schedule TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            worker TEXT,
+            lease_until REAL
+        );
+        CREATE TABLE IF NOT EXISTS batch_items (
+            batch_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            submitted_at TEXT,
+            result TEXT,
+            PRIMARY KEY (batch_id, position)
+        );
+        CREATE INDEX IF NOT EXISTS batches_status ON batches (status, created_at);
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.SCHEMA)
+            try:
+                # The queue holds auth tokens
+                os.chmod(self.path, 0o600)
+            except OSError:
+                pass
+            self._conn = conn
+        return self._conn
+    
+    def _execute(self, sql, params=(), many=False):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return (conn.executemany if many else conn.execute)(sql, params)
+    
+    def _now(self):
+        return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+    
+    def enqueue(self, batch_id, server, siteId, token, options, targets, schedule, created_at):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO batches (id, server, site_id, token, options, status, schedule, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (batch_id, server, siteId, token, json.dumps(options), json.dumps(schedule), created_at, self._now())
+                )
+                conn.executemany(
+                    "INSERT INTO batch_items (batch_id, position, kind, item_id, status) VALUES (?, ?, ?, ?, 'pending')",
+                    [(batch_id, position, kind, item_id) for position, (kind, item_id) in enumerate(targets)]
+                )
+    
+    def claim(self, worker_id):
+        """Lease the oldest queued batch, or one whose worker's lease lapsed; returns its row or None"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                row = conn.execute(
+                    "SELECT * FROM batches WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = conn.execute(
+                    "UPDATE batches SET status = 'running', worker = ?, lease_until = ?, updated_at = ? "
+                    "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND lease_until < ?))",
+                    (worker_id, now + QUEUE_LEASE, self._now(), row['id'], now)
+                ).rowcount
+            return dict(row) if claimed else None
+    
+    def renew(self, batch_id, worker_id):
+        self._execute("UPDATE batches SET lease_until = ? WHERE id = ? AND worker = ?",
+                      (time.time() + QUEUE_LEASE, batch_id, worker_id))
+    
+    def items(self, batch_id):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT * FROM batch_items WHERE batch_id = ? ORDER BY position", (batch_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def mark_submitting(self, batch_id, position, submitted_at):
+        self._execute("UPDATE batch_items SET status = 'submitting', submitted_at = ? WHERE batch_id = ? AND position = ?",
+                      (submitted_at, batch_id, position))
+    
+    def checkpoint(self, batch_id, position, result):
+        self._execute("UPDATE batch_items SET status = 'done', result = ? WHERE batch_id = ? AND position = ?",
+                      (json.dumps(result), batch_id, position))
+    
+    def complete(self, batch_id, status, error=None):
+        self._execute("UPDATE batches SET status = ?, error = ?, token = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+                      (status, error, self._now(), batch_id))
+    
+    def get(self, batch_id):
+        """Return a batch's state and per-item results, or None if unknown"""
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        items = self.items(batch_id)
+        results = [json.loads(item['result']) for item in items if item['result']]
+        succeeded = sum(1 for r in results if r.get('success'))
+        return {
+            'batchId': row['id'],
+            'server': row['server'],
+            'siteId': row['site_id'],
+            'status': row['status'],
+            'error': row['error'],
+            'createdAt': row['created_at'],
+            'updatedAt': row['updated_at'],
+            'schedule': json.loads(row['schedule']) if row['schedule'] else None,
+            'total': len(items),
+            'pending': len(items) - len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'items': [{
+                'type': item['kind'],
+                'id': item['item_id'],
+                'status': item['status'],
+                'result': json.loads(item['result']) if item['result'] else None
+            } for item in items]
+        }
+
+_queue = BatchQueue(QUEUE_DB) if QUEUE_DB else None
+
+def process_batch(queue, worker_id, batch):
+    """Run a claimed batch's unfinished items, checkpointing each result"""
+    server, siteId = batch['server'], batch['site_id']
+    headers = {
+        'X-Tableau-Auth': batch['token'] or '', 
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+    options = json.loads(batch['options'])
+    items = queue.items(batch['id'])
+    results = [json.loads(item['result']) for item in items if item['status'] == 'done']
+    remaining = {(item['kind'], item['item_id']): item for item in items if item['status'] != 'done'}
+    if results:
+        app.logger.info(f"Resuming batch {batch['id']}: {len(results)} done, {len(remaining)} to go")
+    
+    _, datasources = refresh_targets(options)
+    try:
+        refresh = RefreshBatch(server, siteId, headers, options, list(remaining), datasources,
+                               batch_id=batch['id'], submitted_at=batch['created_at'])
+    except ValueError as e:
+        queue.complete(batch['id'], 'failed', str(e))
+        return
+    
+    def run(target):
+        item = remaining[target]
+        kind, item_id = target
+        if item['status'] == 'submitting':
+            # The previous worker may have sent this POST before it stopped
+            job_id, checked = find_refresh_job(server, siteId, headers, kind, item_id, item['submitted_at'])
+            if job_id:
+                return refresh.describe(target, {'id': item_id, 'success': True, 'jobId': job_id, 'message': 'Refresh job found after the batch resumed'})
+            if not checked:
+                # Like refresh_item(), never resend a POST that may have gone through
+                return refresh.describe(target, {
+                    'id': item_id,
+                    'success': False,
+                    'error': 'Refresh may have been submitted before the batch was interrupted; '
+                             'not resubmitted to avoid a duplicate job'
+                })
+        submitted_at = (datetime.utcnow() - timedelta(seconds=JOB_CLOCK_SKEW)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        queue.mark_submitting(batch['id'], item['position'], submitted_at)
+        return refresh.run(target)
+    
+    # Keep the lease alive while admission control or retries hold things up
+    stopped = threading.Event()
+    def renew():
+        while not stopped.wait(QUEUE_LEASE / 3):
+            queue.renew(batch['id'], worker_id)
+    threading.Thread(target=renew, name=f"lease-{batch['id']}", daemon=True).start()
+    
+    try:
+        for target, result in refresh.results(run):
+            queue.checkpoint(batch['id'], remaining[target]['position'], result)
+            results.append(result)
         
-        # Sort workbooks by name for consistent ordering
-        workbook_list.sort(key=lambda x: x['name'].lower())
+        refresh.finish(results, options.get('watch') or _history)
+        queue.complete(batch['id'], 'done')
+    finally:
+        stopped.set()
+
+def drain_queue(queue, worker_id):
+    """Run queued batches until none are left; returns how many were run"""
+    count = 0
+    while True:
+        batch = queue.claim(worker_id)
+        if batch is None:
+            return count
+        try:
+            process_batch(queue, worker_id, batch)
+        except Exception as e:
+            app.logger.error(f"Refresh batch {batch['id']} failed: {e}")
+            queue.complete(batch['id'], 'failed', str(e))
+        count += 1
+
+_queue_worker = None
+_queue_worker_lock = threading.Lock()
+
+def ensure_queue_worker():
+    """Start this process's background queue worker if it isn't running"""
+    global _queue_worker
+    with _queue_worker_lock:
+        if _queue_worker is not None and _queue_worker.is_alive():
+            return
+        worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
         
-        return jsonify(workbooks=workbook_list)
+        def work():
+            while True:
+                try:
+                    drain_queue(_queue, worker_id)
+                except sqlite3.Error as e:
+                    app.logger.error(f"Refresh queue unavailable: {e}")
+                time.sleep(QUEUE_POLL_INTERVAL)
         
-    except requests.exceptions.RequestException as e:
-        app.logger.error(f"Workbooks request failed: {e}")
-        return jsonify(error=f"Connection failed: {str(e)}"), 500
+        _queue_worker = threading.Thread(target=work, name='queue-worker', daemon=True)
+        _queue_worker.start()
+
+@app.route('/api/refresh/plan', methods=['POST'])
+def refresh_plan():
+    """Plan a refresh that collapses workbooks onto their shared published datasources"""
+    data = request.json or {}
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    workbook_ids = list(dict.fromkeys(data.get('workbookIds', [])))
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    try:
+        return jsonify(plan_refresh(server, siteId, headers, workbook_ids))
     except Exception as e:
-        app.logger.error(f"Error fetching workbooks: {e}")
-        return jsonify(error=f"Failed to fetch workbooks: {str(e)}"), 500
+        app.logger.error(f"Error planning refresh: {e}")
+        return jsonify(error=f"Failed to plan refresh: {str(e)}"), 500
+
+@app.route('/api/refresh/schedule', methods=['POST'])
+def refresh_schedule():
+    """Preview the submission order and predicted finish time of a refresh"""
+    data = request.json or {}
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    targets, _ = refresh_targets(data)
+    try:
+        _, schedule = schedule_refresh(server, siteId, headers, data, targets)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(schedule)
 
 @app.route('/api/refresh', methods=['POST'])
 def refresh():
@@ -805,7 +3641,6 @@ def refresh():
     server = data.get('server','').rstrip('/')
     token = data.get('token','')
     siteId = data.get('siteId','')
-    workbook_ids = data.get('workbookIds', [])
     
     headers = {
         'X-Tableau-Auth': token, 
@@ -813,82 +3648,41 @@ def refresh():
         'Content-Type': 'application/json'
     }
     
-    results = []
+    targets, datasources = refresh_targets(data)
+    try:
+        batch = RefreshBatch(server, siteId, headers, data, targets, datasources)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     
-    for wb_id in workbook_ids:
+    if data.get('async'):
+        if not _queue:
+            return jsonify(error="Asynchronous batches are disabled"), 400
+        options = {key: data[key] for key in BATCH_OPTION_KEYS if key in data}
         try:
-            # Use the extract refresh endpoint
-            url = f"{server}/api/3.17/sites/{siteId}/workbooks/{wb_id}/refresh"
-            
-            # Prepare the refresh request body
-            refresh_body = {
-                "task": {
-                    "extractRefresh": {
-                        "type": "FullRefresh"
-                    }
-                }
-            }
-            
-            resp = requests.post(
-                url, 
-                headers=headers, 
-                json=refresh_body,
-                timeout=60
-            )
-            
-            if resp.status_code in [200, 201, 202]:
-                # Parse response to get job information
-                try:
-                    job_info = resp.json()
-                    job_id = job_info.get('job', {}).get('id')
-                    results.append({
-                        'id': wb_id, 
-                        'success': True, 
-                        'jobId': job_id,
-                        'message': 'Refresh job started successfully'
-                    })
-                except:
-                    results.append({
-                        'id': wb_id, 
-                        'success': True,
-                        'message': 'Refresh initiated successfully'
-                    })
-            else:
-                error_msg = f"HTTP {resp.status_code}"
-                try:
-                    error_response = resp.json()
-                    if 'error' in error_response:
-                        error_msg = error_response['error'].get('summary', error_msg)
-                except:
-                    error_msg = resp.text[:200] if resp.text else error_msg
-                    
-                results.append({
-                    'id': wb_id, 
-                    'success': False, 
-                    'error': error_msg
-                })
-                
-        except requests.exceptions.Timeout:
-            results.append({
-                'id': wb_id, 
-                'success': False, 
-                'error': 'Request timeout - refresh may still be processing'
-            })
-        except requests.exceptions.RequestException as e:
-            results.append({
-                'id': wb_id, 
-                'success': False, 
-                'error': f'Connection error: {str(e)}'
-            })
-        except Exception as e:
-            app.logger.error(f"Error refreshing workbook {wb_id}: {e}")
-            results.append({
-                'id': wb_id, 
-                'success': False, 
-                'error': f'Unexpected error: {str(e)}'
-            })
+            _queue.enqueue(batch.id, server, siteId, token, options, targets, batch.prediction, batch.submitted_at)
+        except sqlite3.Error as e:
+            app.logger.error(f"Failed to queue refresh batch: {e}")
+            return jsonify(error=f"Failed to queue refresh batch: {str(e)}"), 500
+        ensure_queue_worker()
+        resp = jsonify(batchId=batch.id, status='queued', total=len(targets), schedule=batch.prediction)
+        resp.headers['X-Batch-Id'] = batch.id
+        return resp, 202
+    
+    if data.get('stream'):
+        resp = Response(stream_refresh(batch, data.get('watch') or _history), mimetype='application/x-ndjson')
+        resp.headers['X-Batch-Id'] = batch.id
+        resp.headers['X-Predicted-Finish'] = batch.prediction['predictedFinishAt']
+        return resp
     
-    return jsonify(results)
+    # Submit in schedule order, but report results in the order of workbookIds
+    by_target = dict(batch.results())
+    results = [by_target[target] for target in targets]
+    batch.finish(results, data.get('watch') or _history)
+    
+    resp = jsonify(results)
+    resp.headers['X-Batch-Id'] = batch.id
+    resp.headers['X-Predicted-Finish'] = batch.prediction['predictedFinishAt']
+    return resp
 
 @app.route('/api/jobs/<job_id>', methods=['GET'])
 def get_job_status(job_id):
@@ -905,7 +3699,7 @@ def get_job_status(job_id):
     
     try:
         url = f"{server}/api/3.17/sites/{siteId}/jobs/{job_id}"
-        resp = requests.get(url, headers=headers, timeout=30)
+        resp = tableau_call(server, 'GET', url, headers=headers, timeout=30)
         
         if resp.status_code == 200:
             return jsonify(resp.json())
@@ -919,6 +3713,419 @@ def get_job_status(job_id):
         app.logger.error(f"Error checking job status: {e}")
         return jsonify(error=f"Failed to get job status: {str(e)}"), 500
 
+# Query Jobs reports status names; single-job GETs report a finishCode instead
+FINISH_CODES = {'0': 'Success', '1': 'Failed', '2': 'Cancelled'}
+
+def job_summary(job):
+    """Reduce a Tableau job record from either endpoint to a compact status entry"""
+    status = job.get('status')
+    if not status:
+        finish_code = job.get('finishCode')
+        if finish_code is not None:
+            status = FINISH_CODES.get(str(finish_code), 'Failed')
+        else:
+            status = 'InProgress' if job.get('startedAt') else 'Pending'
+    
+    return {
+        'status': status,
+        'createdAt': job.get('createdAt'),
+        'startedAt': job.get('startedAt'),
+        'endedAt': job.get('endedAt') or job.get('completedAt')
+    }
+
+def fetch_job_statuses(server, siteId, headers, job_ids, since=None):
+    """Resolve many job IDs to compact statuses with as few calls as possible.
+
+    The site jobs listing (filtered to extract refreshes created since the
+    batch started) answers most IDs a page at a time; anything it misses is
+    fetched individually on a bounded pool.
+    """
+    wanted = set(job_ids)
+    statuses = {}
+    
+    filters = ['jobType:eq:refresh_extracts']
+    if since:
+        filters.append(f'createdAt:gte:{since}')
+    
+    url = f"{server}/api/3.17/sites/{siteId}/jobs"
+    for page_number in range(1, JOB_QUERY_MAX_PAGES + 1):
+        params = {
+            'pageSize': 1000,
+            'pageNumber': page_number,
+            'filter': ','.join(filters)
+        }
+        resp = tableau_call(server, 'GET', url, headers=headers, params=params, timeout=30)
+        if resp.status_code != 200:
+            # Older servers lack the listing or the filter; fall back to single GETs
+            app.logger.warning(f"Job listing failed ({resp.status_code}), using per-job lookups")
+            break
+        
+        body = resp.json()
+        for job in body.get('backgroundJobs', {}).get('backgroundJob', []):
+            if job.get('id') in wanted:
+                statuses[job['id']] = job_summary(job)
+        
+        pagination = body.get('pagination', {})
+        if len(statuses) == len(wanted) or page_number * int(pagination.get('pageSize', 1000)) >= int(pagination.get('totalAvailable', 0)):
+            break
+    
+    missing = [job_id for job_id in job_ids if job_id not in statuses]
+    
+    def fetch(job_id):
+        try:
+            resp = tableau_call(server, 'GET', f"{url}/{job_id}", headers=headers, timeout=30)
+            if resp.status_code == 200:
+                return job_id, job_summary(resp.json().get('job', {}))
+            return job_id, {'status': 'Unknown', 'error': f"HTTP {resp.status_code}"}
+        except requests.exceptions.RequestException as e:
+            return job_id, {'status': 'Unknown', 'error': f"Connection error: {str(e)}"}
+    
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(JOB_STATUS_CONCURRENCY, len(missing))) as pool:
+            statuses.update(pool.map(fetch, missing))
+    
+    return statuses
+
+@app.route('/api/jobs/status', methods=['POST'])
+def bulk_job_status():
+    """Get the status of many refresh jobs, by job IDs or by refresh batch ID"""
+    data = request.json or {}
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    job_ids = list(dict.fromkeys(data.get('jobIds', [])))
+    since = data.get('since')
+    workbooks_by_job = {}
+    
+    batch_id = data.get('batchId')
+    if batch_id:
+        batch = _batches.peek(batch_id)
+        if batch is None or (batch['server'], batch['siteId']) != (server, siteId):
+            return jsonify(error=f"Unknown batch: {batch_id}"), 404
+        workbooks_by_job = batch['jobs']
+        job_ids = list(workbooks_by_job)
+        since = since or batch['submittedAt']
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    try:
+        statuses = fetch_job_statuses(server, siteId, headers, job_ids, since) if job_ids else {}
+        for job_id, workbook_id in workbooks_by_job.items():
+            status = statuses[job_id]
+            status['workbookId'] = workbook_id
+            run_seconds = seconds_between(status.get('startedAt'), status.get('endedAt'))
+            if status['status'] == 'Success' and run_seconds is not None:
+                _durations.record(server, siteId, workbook_id, run_seconds, job_id)
+            if _history:
+                _history.record_outcome(server, siteId, job_id, status)
+        
+        counts = {}
+        for status in statuses.values():
+            counts[status['status']] = counts.get(status['status'], 0) + 1
+        
+        return jsonify(jobs=statuses, counts=counts)
+        
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Bulk job status request failed: {e}")
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    except Exception as e:
+        app.logger.error(f"Error checking job statuses: {e}")
+        return jsonify(error=f"Failed to get job statuses: {str(e)}"), 500
+
+TERMINAL_STATUSES = {'Success', 'Failed', 'Cancelled', 'Unknown'}
+
+def seconds_between(start, end):
+    """Seconds between two Tableau timestamps, or None if either is missing"""
+    if not start or not end:
+        return None
+    fmt = '%Y-%m-%dT%H:%M:%SZ'
+    try:
+        return int((datetime.strptime(end, fmt) - datetime.strptime(start, fmt)).total_seconds())
+    except ValueError:
+        return None
+
+class JobWatcher:
+    """Follows one refresh batch's jobs in a background thread.
+
+    Every state change is appended to an event log that any number of
+    subscribers can read from their own offset, so the batch is polled once
+    no matter how many browsers are watching it.
+    """
+    def __init__(self, batch_id, server, siteId, headers, jobs, since=None, max_duration=WATCH_MAX_DURATION):
+        self.batch_id = batch_id
+        self.server = server
+        self.siteId = siteId
+        self.headers = headers
+        self.jobs = jobs
+        self.since = since
+        self.max_duration = max_duration
+        self.states = {job_id: 'Pending' for job_id in jobs}
+        self.events = []
+        self.finished = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"watch-{batch_id}", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        interval = WATCH_MIN_INTERVAL
+        deadline = time.monotonic() + self.max_duration
+        unknown_polls = {}
+        
+        while time.monotonic() < deadline:
+            pending = [job_id for job_id, status in self.states.items() if status not in TERMINAL_STATUSES]
+            if not pending:
+                break
+            time.sleep(interval)
+            
+            try:
+                statuses = fetch_job_statuses(self.server, self.siteId, self.headers, pending, self.since)
+            except Exception as e:
+                app.logger.warning(f"Job watcher poll for batch {self.batch_id} failed: {e}")
+                statuses = {}
+            
+            changed = False
+            for job_id in pending:
+                summary = statuses.get(job_id)
+                if not summary:
+                    continue
+                if summary['status'] == 'Unknown':
+                    unknown_polls[job_id] = unknown_polls.get(job_id, 0) + 1
+                    if unknown_polls[job_id] < WATCH_UNKNOWN_LIMIT:
+                        continue
+                if summary['status'] != self.states[job_id]:
+                    self._emit(job_id, summary)
+                    changed = True
+            
+            # Poll quickly while jobs are moving, back off while they run
+            interval = WATCH_MIN_INTERVAL if changed else min(interval * WATCH_BACKOFF, WATCH_MAX_INTERVAL)
+        
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+    
+    def _emit(self, job_id, summary):
+        event = {
+            'jobId': job_id,
+            'workbookId': self.jobs.get(job_id),
+            'from': self.states[job_id],
+            'to': summary['status'],
+            'at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'queuedSeconds': seconds_between(summary.get('createdAt'), summary.get('startedAt')),
+            'runSeconds': seconds_between(summary.get('startedAt'), summary.get('endedAt'))
+        }
+        if event['to'] == 'Success' and event['runSeconds'] is not None:
+            _durations.record(self.server, self.siteId, event['workbookId'], event['runSeconds'], job_id)
+        if _history:
+            _history.record_outcome(self.server, self.siteId, job_id, summary)
+        with self._cond:
+            self.states[job_id] = summary['status']
+            self.events.append(event)
+            self._cond.notify_all()
+    
+    def wait_events(self, offset, timeout):
+        """Return events after offset (waiting up to timeout for some) and whether watching has ended"""
+        with self._cond:
+            if len(self.events) <= offset and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[offset:], self.finished
+    
+    def counts(self):
+        with self._cond:
+            counts = {}
+            for status in self.states.values():
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+_watchers = TTLCache(BATCH_TTL, BATCH_HISTORY_SIZE)
+_watchers_lock = threading.Lock()
+
+def start_watcher(batch_id, server, siteId, headers):
+    """Return the running watcher for a batch, starting one if needed"""
+    batch = _batches.peek(batch_id)
+    if batch is None or (batch['server'], batch['siteId']) != (server, siteId):
+        raise KeyError(batch_id)
+    
+    with _watchers_lock:
+        watcher = _watchers.peek(batch_id)
+        if watcher is None:
+            watcher = JobWatcher(batch_id, server, siteId, headers, batch['jobs'], batch['submittedAt']).start()
+            _watchers.put(batch_id, watcher)
+        return watcher
+
+def stream_job_events(watcher, offset):
+    """Yield a watcher's job transitions as Server-Sent Events, then a done event"""
+    while True:
+        events, finished = watcher.wait_events(offset, WATCH_HEARTBEAT)
+        for event in events:
+            offset += 1
+            yield f"id: {offset}\nevent: job\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        if finished and not events:
+            yield f"event: done\ndata: {json.dumps({'counts': watcher.counts()}, separators=(',', ':'))}\n\n"
+            return
+        if not events:
+            yield ": keepalive\n\n"
+
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def batch_state(batch_id):
+    """Get the state and per-item results of an asynchronous refresh batch"""
+    data = request.args
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    if not _queue:
+        return jsonify(error="Asynchronous batches are disabled"), 404
+    try:
+        # Only callers signed in to the batch's site may read it
+        catalog_scope(server, siteId, headers)
+        state = _queue.get(batch_id)
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    except sqlite3.Error as e:
+        app.logger.error(f"Refresh queue query failed: {e}")
+        return jsonify(error=f"Failed to read batch: {str(e)}"), 500
+    
+    if state is None or (state.pop('server'), state.pop('siteId')) != (server, siteId):
+        return jsonify(error=f"Unknown batch: {batch_id}"), 404
+    
+    # Resume queued batches if this process's worker isn't running yet
+    if state['status'] in ('queued', 'running'):
+        ensure_queue_worker()
+    return jsonify(state)
+
+@app.route('/api/batches/<batch_id>/events', methods=['GET'])
+def batch_events(batch_id):
+    """Push job state changes for a refresh batch as Server-Sent Events"""
+    data = request.args
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    try:
+        # Only callers signed in to the batch's site may watch it; the
+        # watcher polls Tableau with the subscriber's token
+        catalog_scope(server, siteId, headers)
+        watcher = start_watcher(batch_id, server, siteId, headers)
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    except KeyError:
+        return jsonify(error=f"Unknown batch: {batch_id}"), 404
+    
+    # EventSource resends the last id it saw when reconnecting
+    try:
+        offset = int(request.headers.get('Last-Event-ID') or data.get('after', 0))
+    except ValueError:
+        offset = 0
+    
+    resp = Response(stream_job_events(watcher, offset), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+@app.route('/api/history/stats', methods=['POST'])
+def history_stats():
+    """Report refresh duration percentiles, failure rates and trends per workbook or project"""
+    data = request.json or {}
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    group_by = data.get('groupBy', 'workbook')
+    
+    if not _history:
+        return jsonify(error="Refresh history is disabled"), 404
+    if group_by not in ('workbook', 'project'):
+        return jsonify(error="groupBy must be workbook or project"), 400
+    try:
+        days = int(data.get('days', HISTORY_STATS_DAYS))
+    except (TypeError, ValueError):
+        return jsonify(error="days must be numeric"), 400
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    # Only callers signed in to the site may read its history
+    try:
+        catalog_scope(server, siteId, headers)
+        return jsonify(_history.stats(server, siteId, group_by, days))
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    except sqlite3.Error as e:
+        app.logger.error(f"Refresh history query failed: {e}")
+        return jsonify(error=f"Failed to read refresh history: {str(e)}"), 500
+
+@app.route('/api/limits', methods=['GET'])
+def concurrency_limits():
+    """Report a Tableau server's adaptive concurrency limit and recent throttling"""
+    data = request.args
+    server = data.get('server','').rstrip('/')
+    token = data.get('token','')
+    siteId = data.get('siteId','')
+    if not (server and siteId and token):
+        return jsonify(error="server, siteId and token are required"), 400
+    
+    headers = {
+        'X-Tableau-Auth': token, 
+        'Accept': 'application/json'
+    }
+    
+    # Only callers signed in to the server may see its throttling
+    try:
+        catalog_scope(server, siteId, headers)
+    except TableauError as e:
+        return jsonify(error=str(e)), e.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify(error=f"Connection failed: {str(e)}"), 500
+    
+    with _server_limiters_lock:
+        limiter = _server_limiters.get(server)
+    return jsonify(servers={server: limiter.snapshot()} if limiter else {})
+
+@app.after_request
+def compress_response(resp):
+    """Compress responses the client accepts compressed"""
+    if resp.mimetype not in COMPRESSIBLE_TYPES or resp.status_code < 200 or resp.status_code in (204, 304):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    if 'Content-Encoding' in resp.headers:
+        return resp
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return resp
+    
+    if resp.is_streamed:
+        resp.response = compress_stream(resp.response, encoding)
+    else:
+        body = resp.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return resp
+        resp.set_data(compress(body, encoding))
+    resp.headers['Content-Encoding'] = encoding
+    return resp
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
@@ -926,8 +4133,301 @@ def health_check():
         'timestamp': datetime.utcnow().isoformat()
     })
 
+class TableauClient:
+    """Tableau REST client for scripts and scheduled jobs outside the web UI.
+
+    Goes through the same pooled sessions, adaptive concurrency limit,
+    retries and refresh batching as the web endpoints.
+    """
+    def __init__(self, server, token, site_id):
+        self.server = server.rstrip('/')
+        self.token = token
+        self.site_id = site_id
+    
+    @classmethod
+    def sign_in(cls, server, token_name, token_secret, site=''):
+        """Sign in with a Personal Access Token and return a client for the site"""
+        server = server.rstrip('/')
+        creds = _tokens.sign_in(server, token_name, token_secret, site)
+        return cls(server, creds['token'], creds['siteId'])
+    
+    def sign_out(self):
+        _tokens.forget(self.token)
+        try:
+            tableau_session(self.server).post(f"{self.server}/api/3.17/auth/signout", headers=self.headers, timeout=30)
+        except requests.exceptions.RequestException as e:
+            app.logger.warning(f"Sign-out failed: {e}")
+    
+    @property
+    def headers(self):
+        return {
+            'X-Tableau-Auth': self.token, 
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+    
+    def workbooks(self):
+        """Yield every workbook on the site in the record shape the UI uses"""
+        for page in iter_workbook_pages(self.server, self.site_id, self.headers):
+            for wb in page:
+                yield workbook_info(wb)
+    
+    def select(self, projects=(), owners=(), tags=(), ids=None):
+        """Return workbooks matching the selection.
+
+        Each non-empty criterion must match; within one, any value will do.
+        ids, when given, always applies: an empty list selects nothing.
+        """
+        projects, owners, tags = set(projects), set(owners), set(tags)
+        ids = set(ids) if ids is not None else None
+        selected = []
+        for wb in self.workbooks():
+            if ids is not None and wb['id'] not in ids:
+                continue
+            if projects and wb['project'] not in projects:
+                continue
+            if owners and wb['owner'] not in owners:
+                continue
+            if tags and not tags.intersection(wb.get('tags') or []):
+                continue
+            selected.append(wb)
+        return selected
+    
+    def plan(self, workbook_ids):
+        """Plan refreshes onto shared published datasources, as /api/refresh/plan does"""
+        return plan_refresh(self.server, self.site_id, self.headers, workbook_ids)
+    
+    def refresh(self, workbook_ids, plan=None, **options):
+        """Return a RefreshBatch for the workbooks (or a plan); iterate its results() to submit"""
+        targets, datasources = refresh_targets({'workbookIds': workbook_ids, 'plan': plan})
+        return RefreshBatch(self.server, self.site_id, self.headers, options, targets, datasources)
+    
+    def job_statuses(self, job_ids, since=None):
+        return fetch_job_statuses(self.server, self.site_id, self.headers, job_ids, since)
+    
+    def job_events(self, jobs, since=None, max_duration=WATCH_MAX_DURATION):
+        """Yield job state changes until every job finishes or max_duration passes.
+
+        jobs maps job IDs to the workbook or datasource each one refreshes.
+        """
+        watcher = JobWatcher(uuid.uuid4().hex, self.server, self.site_id, self.headers, jobs, since, max_duration).start()
+        offset = 0
+        while True:
+            events, finished = watcher.wait_events(offset, WATCH_HEARTBEAT)
+            offset += len(events)
+            yield from events
+            if finished and not events:
+                return
+
+def benchmark_catalog(count, repeat=3):
+    """Time and size the /api/workbooks body before and after the fast paths.
+
+    "jsonify" is the previous response (Flask's encoder: sorted keys, ASCII
+    escapes); the rest use dumps_json, then gzip and brotli. "columnar" is
+    the compact format with the fields the page requests. Encoding times
+    include serialization; parse times are json.loads of the uncompressed
+    body, a stand-in for the browser's JSON.parse.
+    """
+    rng = random.Random(0)
+    workbooks = [{
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'name': f"Workbook {i} – {rng.choice(['Sales', 'Finance', 'Ops', 'Marketing'])} dashboard",
+        'project': f"Project {rng.randrange(200)}",
+        'owner': f"Owner {rng.randrange(500)}",
+        'createdAt': f"2023-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T08:00:00Z",
+        'updatedAt': f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T17:30:00Z",
+        'size': str(rng.randrange(1, 2000)),
+        'contentUrl': f"Workbook{i}",
+        'showTabs': rng.choice(['true', 'false']),
+        'tags': rng.sample(['nightly', 'finance', 'certified', 'exec', 'deprecated'], rng.randrange(3))
+    } for i in range(count)]
+    payload = {'workbooks': workbooks}
+    
+    def measure(encode):
+        best = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            body = encode()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return body, best
+    
+    page_fields = ('id', 'name', 'project', 'owner', 'createdAt', 'updatedAt', 'size')
+    
+    with app.app_context():
+        baseline, baseline_time = measure(lambda: app.json.dumps(payload).encode())
+    fast, fast_time = measure(lambda: dumps_json(payload))
+    columnar, columnar_time = measure(lambda: dumps_json(columnar_catalog(workbooks, page_fields)))
+    variants = [
+        ('jsonify', baseline, baseline_time, baseline),
+        ('fast' + (' (orjson)' if orjson else ''), fast, fast_time, fast),
+        ('columnar', columnar, columnar_time, columnar)
+    ]
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and brotli is None:
+            continue
+        body, elapsed = measure(lambda: compress(dumps_json(payload), encoding))
+        variants.append((f"fast+{encoding}", body, elapsed, fast))
+        body, elapsed = measure(lambda: compress(dumps_json(columnar_catalog(workbooks, page_fields)), encoding))
+        variants.append((f"columnar+{encoding}", body, elapsed, columnar))
+    
+    for name, body, elapsed, raw in variants:
+        _, parse_time = measure(lambda: json.loads(raw))
+        yield {
+            'variant': name,
+            'workbooks': count,
+            'encodeMs': round(elapsed * 1000, 1),
+            'parseMs': round(parse_time * 1000, 1),
+            'bytes': len(body),
+            'ratio': round(len(body) / len(baseline), 3)
+        }
+
+def main(argv=None):
+    """Command-line entry point: list or refresh a selection of workbooks as NDJSON"""
+    parser = argparse.ArgumentParser(
+        prog='python api/index.py',
+        description="Refresh Tableau extracts without the web UI. Output is one JSON object per line."
+    )
+    parser.add_argument('--server', default=os.environ.get('TABLEAU_SERVER'),
+                        help="Tableau Server URL (default: $TABLEAU_SERVER)")
+    parser.add_argument('--site', default=os.environ.get('TABLEAU_SITE', ''),
+                        help="site content URL, empty for the default site (default: $TABLEAU_SITE)")
+    parser.add_argument('--token-name', default=os.environ.get('TABLEAU_TOKEN_NAME'),
+                        help="Personal Access Token name (default: $TABLEAU_TOKEN_NAME)")
+    parser.add_argument('--token-secret', default=os.environ.get('TABLEAU_TOKEN_SECRET'),
+                        help="Personal Access Token secret (default: $TABLEAU_TOKEN_SECRET)")
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'), default=sys.stdout,
+                        help="write results here instead of stdout")
+    
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument('--project', action='append', default=[], help="select workbooks in this project (repeatable)")
+    selection.add_argument('--owner', action='append', default=[], help="select workbooks with this owner (repeatable)")
+    selection.add_argument('--tag', action='append', default=[], help="select workbooks with this tag (repeatable)")
+    selection.add_argument('--id', action='append', default=[], help="select this workbook id (repeatable)")
+    selection.add_argument('--ids-file', type=argparse.FileType('r'), help="select the workbook ids listed one per line in this file")
+    
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('workbooks', parents=[selection], help="list the selected workbooks")
+    benchmark_parser = commands.add_parser('benchmark', help="measure catalog response encode time and size")
+    benchmark_parser.add_argument('--workbooks', type=int, default=20000, help="synthetic catalog size")
+    benchmark_parser.add_argument('--repeat', type=int, default=3, help="runs per measurement; the fastest is reported")
+    worker_parser = commands.add_parser('worker', help="run queued asynchronous refresh batches")
+    worker_parser.add_argument('--once', action='store_true', help="exit when the queue is empty instead of waiting for more")
+    refresh_parser = commands.add_parser('refresh', parents=[selection], help="refresh the selected workbooks' extracts")
+    refresh_parser.add_argument('--concurrency', type=int, default=REFRESH_CONCURRENCY)
+    refresh_parser.add_argument('--timeout', type=float, default=REFRESH_TIMEOUT, help="seconds per refresh request")
+    refresh_parser.add_argument('--refresh-type', choices=sorted(REFRESH_POLICIES), default=REFRESH_TYPE)
+    refresh_parser.add_argument('--schedule', choices=sorted(SCHEDULE_POLICIES), default=SCHEDULE_POLICY)
+    refresh_parser.add_argument('--slots', type=int, default=BACKGROUNDER_SLOTS, help="backgrounders assumed for the finish time prediction")
+    refresh_parser.add_argument('--admission-depth', type=int,
+                                help="hold submissions while this many extract jobs are queued or running")
+    refresh_parser.add_argument('--shared-datasources', action='store_true',
+                                help="refresh shared published datasources once instead of every workbook using them")
+    refresh_parser.add_argument('--all', action='store_true', help="refresh every workbook on the site (required when nothing else is selected)")
+    refresh_parser.add_argument('--dry-run', action='store_true', help="print the planned schedule without submitting")
+    refresh_parser.add_argument('--wait', action='store_true', help="follow the jobs until they finish")
+    refresh_parser.add_argument('--wait-timeout', type=float, default=WATCH_MAX_DURATION, help="longest time to follow the jobs, in seconds")
+    
+    args = parser.parse_args(argv)
+    if args.command == 'benchmark':
+        for line in benchmark_catalog(args.workbooks, args.repeat):
+            args.output.write(ndjson(line))
+        return 0
+    if args.command == 'worker':
+        if not _queue:
+            parser.error("QUEUE_DB is empty, so asynchronous batches are disabled")
+        worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        while True:
+            count = drain_queue(_queue, worker_id)
+            if args.once:
+                args.output.write(ndjson({'done': True, 'batches': count}))
+                return 0
+            time.sleep(QUEUE_POLL_INTERVAL)
+    
+    for name in ('server', 'token_name', 'token_secret'):
+        if not getattr(args, name):
+            parser.error(f"--{name.replace('_', '-')} is required")
+    
+    ids = list(args.id)
+    if args.ids_file:
+        ids += [line.strip() for line in args.ids_file if line.strip()]
+    by_id = bool(args.id or args.ids_file)
+    
+    # Never refresh a whole site by accident
+    if args.command == 'refresh' and not (args.project or args.owner or args.tag or by_id or args.all):
+        parser.error("refresh needs a selection (--project, --owner, --tag, --id or --ids-file), or --all for every workbook")
+    
+    def emit(obj):
+        args.output.write(ndjson(obj))
+        args.output.flush()
+    
+    try:
+        client = TableauClient.sign_in(args.server, args.token_name, args.token_secret, args.site)
+    except (TableauError, requests.exceptions.RequestException) as e:
+        emit({'error': str(e)})
+        return 1
+    
+    try:
+        workbooks = client.select(args.project, args.owner, args.tag, ids if by_id else None)
+        if args.command == 'workbooks':
+            for wb in workbooks:
+                emit(wb)
+            return 0
+        
+        workbook_ids = [wb['id'] for wb in workbooks]
+        plan = client.plan(workbook_ids) if args.shared_datasources and workbook_ids else None
+        if plan and plan['skipped']:
+            emit({'skipped': plan['skipped']})
+        options = {
+            'concurrency': args.concurrency,
+            'timeout': args.timeout,
+            'refreshType': args.refresh_type,
+            'schedule': args.schedule,
+            'slots': args.slots,
+            'sizes': {wb['id']: wb.get('size') for wb in workbooks}
+        }
+        if args.admission_depth:
+            options['admission'] = {'targetDepth': args.admission_depth}
+        batch = client.refresh(workbook_ids, plan, **options)
+        
+        if args.dry_run:
+            emit(batch.schedule)
+            return 0
+        
+        results = []
+        for _, result in batch.results():
+            results.append(result)
+            emit(result)
+        batch.finish(results)
+        done = batch.summary(results)
+        
+        ok = done['failed'] == 0
+        
+        if args.wait:
+            jobs = {r['jobId']: r['id'] for r in results if r.get('jobId')}
+            states = {job_id: 'Pending' for job_id in jobs}
+            for event in client.job_events(jobs, batch.submitted_at, args.wait_timeout):
+                states[event['jobId']] = event['to']
+                emit(event)
+            counts = {}
+            for status in states.values():
+                counts[status] = counts.get(status, 0) + 1
+            done['jobs'] = counts
+            ok = ok and counts.get('Success', 0) == len(jobs)
+        
+        emit(done)
+        return 0 if ok else 1
+    
+    except (TableauError, ValueError, requests.exceptions.RequestException) as e:
+        emit({'error': str(e)})
+        return 1
+    finally:
+        client.sign_out()
+
 # This is required for Vercel deployment
 app.wsgi_app = app.wsgi_app
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(main())
     app.run(debug=True) 
\ No newline at end of file